@@ -2,8 +2,9 @@ import logging
 import os
 from celery import Celery
 from flask import Flask
-from flask.ext.sqlalchemy import SQLAlchemy
 from werkzeug.contrib.fixers import ProxyFix
+from app.utils.confgen import template_cache, rendered_result_cache
+from app.utils.database import SQLAlchemy
 from config import STATIC_URL_PATH
 
 # configure logging
@@ -67,6 +68,24 @@ if not os.path.exists(app.config["FTP_DIRECTORY"]):
 else:
     logging.getLogger().info("set FTP directory to %s" % app.config["FTP_DIRECTORY"])
 
+# configure the compiled template and rendered result cache
+template_cache.maxsize = app.config["TEMPLATE_CACHE_SIZE"]
+template_cache.module_directory = app.config["TEMPLATE_MODULE_DIRECTORY"]
+rendered_result_cache.directory = app.config["RENDERED_RESULT_DIRECTORY"]
+
+if template_cache.module_directory:
+    logging.getLogger().info("set template module directory to %s" % template_cache.module_directory)
+    try:
+        os.makedirs(template_cache.module_directory, exist_ok=True)
+
+    except:
+        logging.getLogger().error("unable to create template module directory, templates are compiled in memory",
+                                  exc_info=True)
+        template_cache.module_directory = None
+
+if rendered_result_cache.directory:
+    logging.getLogger().info("set rendered result directory to %s" % rendered_result_cache.directory)
+
 # required for gunicorn
 app.wsgi_app = ProxyFix(app.wsgi_app)
 
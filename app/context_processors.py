@@ -1,27 +1,135 @@
-from app import app
-from app.models import Project
+import itertools
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from app import app, db
+from app.models import Project, ConfigTemplate, ProjectDataRevision
 
+# cached sidebar data including the database revision it was loaded from, the generation is changed whenever the cache
+# is invalidated within this process
+_project_data_cache = {
+    "data": None,
+    "revision": None,
+    "generation": 0
+}
+_project_data_lock = threading.Lock()
 
-@app.context_processor
-def inject_all_project_data():
+# key within the session info, that marks a session with changed Projects or Config Templates
+PROJECT_DATA_CHANGED = "project_data_changed"
+
+# attributes that are shown in the sidebar (a Config Template is moved by the project or the project_id)
+SIDEBAR_ATTRIBUTES = {
+    Project: ("name",),
+    ConfigTemplate: ("name", "project", "project_id")
+}
+
+
+def invalidate_project_data_cache():
     """
-    returns all Project names and ID's from the database to build the sidebar
+    drop the cached sidebar data, it is loaded again on the next request
     :return:
     """
-    projects = Project.query.all()
+    with _project_data_lock:
+        _project_data_cache["data"] = None
+        _project_data_cache["generation"] += 1
+
+
+def load_all_project_data():
+    """
+    load all Project names and ID's including the associated Config Templates using a single query
+    :return:
+    """
+    query = db.session.query(
+        Project.id,
+        Project.name,
+        ConfigTemplate.id,
+        ConfigTemplate.name
+    ).outerjoin(
+        ConfigTemplate, ConfigTemplate.project_id == Project.id
+    ).order_by(Project.id, ConfigTemplate.id)
+
     result = []
-    for p in projects:
+    for (project_id, project_name), rows in itertools.groupby(query, key=lambda row: (row[0], row[1])):
         p_dict = dict()
-        p_dict["id"] = p.id
-        p_dict["name"] = p.name
+        p_dict["id"] = project_id
+        p_dict["name"] = project_name
         p_dict["config_templates"] = []
 
-        for cfg in p.configtemplates.all():
-            p_dict["config_templates"].append({
-                "id": cfg.id,
-                "name": cfg.name
-            })
+        for row in rows:
+            if row[2] is not None:
+                p_dict["config_templates"].append({
+                    "id": row[2],
+                    "name": row[3]
+                })
 
         result.append(p_dict)
 
-    return dict(all_project_data=result)
+    return result
+
+
+def get_all_project_data():
+    """
+    returns the cached sidebar data. The cache is invalidated if a Project or Config Template is changed within this
+    process, changes of other processes are detected using the `ProjectDataRevision` (checked on every call).
+    :return:
+    """
+    # the revision is read before the data, a concurrent change leads to a reload on the next call
+    revision = ProjectDataRevision.get_revision(db.session)
+    with _project_data_lock:
+        data = _project_data_cache["data"]
+        generation = _project_data_cache["generation"]
+        if data is not None and _project_data_cache["revision"] == revision:
+            return data
+
+    data = load_all_project_data()
+
+    # uncommitted changes of the current session are not cached
+    if not db.session().info.get(PROJECT_DATA_CHANGED):
+        with _project_data_lock:
+            if _project_data_cache["generation"] == generation:
+                _project_data_cache["data"] = data
+                _project_data_cache["revision"] = revision
+
+    return data
+
+
+def _has_sidebar_changes(obj):
+    return any(get_history(obj, name).has_changes() for name in SIDEBAR_ATTRIBUTES[type(obj)])
+
+
+@event.listens_for(Session, "before_flush")
+def track_project_data_changes(session, flush_context, instances):
+    """increment the Project Data Revision if a value of the sidebar is changed (the name of a Project or Config
+    Template or the Config Templates of a Project), other changes keep the cached sidebar data
+
+    :param session:
+    :param flush_context:
+    :param instances:
+    :return:
+    """
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Project, ConfigTemplate)):
+            if obj in session.dirty and not _has_sidebar_changes(obj):
+                continue
+
+            session.info[PROJECT_DATA_CHANGED] = True
+            invalidate_project_data_cache()
+            ProjectDataRevision.increment(session)
+            break
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def invalidate_project_data_after_transaction(session):
+    if session.info.pop(PROJECT_DATA_CHANGED, False):
+        invalidate_project_data_cache()
+
+
+@app.context_processor
+def inject_all_project_data():
+    """
+    returns all Project names and ID's from the database to build the sidebar
+    :return:
+    """
+    return dict(all_project_data=get_all_project_data())
@@ -2,6 +2,7 @@
 WTF forms for the web service
 """
 from flask_wtf import Form
+from flask_wtf.file import FileField
 from wtforms import ValidationError, StringField, TextAreaField
 from wtforms.validators import DataRequired
 from wtforms.ext.sqlalchemy.orm import model_form
@@ -54,6 +55,7 @@ class ConfigTemplateForm(Form):
 
 class EditConfigTemplateValuesForm(Form):
     csv_content = TextAreaField("Template Value Sets")
+    csv_file = FileField("CSV file (replaces the content of the textarea)")
 
 
 ProjectForm = model_form(
@@ -69,7 +71,7 @@ TemplateValueSetForm = model_form(
     base_class=Form,
     db_session=db.session,
     exclude_fk=True,
-    exclude=['config_template']
+    exclude=['config_template', 'revision', 'packed_values']
 )
 
 TemplateVariableForm = model_form(
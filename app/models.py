@@ -1,10 +1,20 @@
 """
 SQLAlchemy data model for the web service
 """
+import itertools
+import json
+import sys
+import uuid
+from collections import OrderedDict
 from slugify.main import Slugify
-from app import db
+from sqlalchemy import bindparam, event, literal
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, aliased
+from app import app, db
 from app.exception import TemplateVariableNotFoundException, TemplateValueNotFoundException
 from app.utils import MakoConfigGenerator
+from app.utils.confgen import RenderResult, get_template_hash, rendered_result_cache
+from app.utils.database import supports_upsert, upsert_statement
 
 
 class TemplateValue(db.Model):
@@ -15,19 +25,27 @@ class TemplateValue(db.Model):
     The template value definition is used to associate a value to a variable within a Template Value Set.
 
     """
-    __table_args__ = (db.UniqueConstraint('var_name_slug', 'template_value_set_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('var_name_slug', 'template_value_set_id'),
+        # the values are loaded per Template Value Set
+        db.Index('ix_template_value_template_value_set_id_var_name_slug', 'template_value_set_id', 'var_name_slug'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     var_name_slug = db.Column(
         db.String(256),
-        index=True,
         nullable=False
     )
-    value = db.Column(db.String(4096), index=True)
+    value = db.Column(db.String(4096))
 
-    template_value_set_id = db.Column(db.Integer, db.ForeignKey('template_value_set.id'), nullable=False)
+    template_value_set_id = db.Column(
+        db.Integer,
+        db.ForeignKey('template_value_set.id', ondelete="CASCADE"),
+        nullable=False
+    )
     template_value_set = db.relationship('TemplateValueSet', backref=db.backref('values',
                                                                                 cascade="all, delete-orphan",
+                                                                                passive_deletes=True,
                                                                                 lazy='dynamic'))
 
     @staticmethod
@@ -39,6 +57,21 @@ class TemplateValue(db.Model):
         """
         return Slugify(separator="_", to_lower=False)(string)
 
+    @staticmethod
+    def new_values_statement(update_existing=False):
+        """create the bulk statement that inserts new Template Values, an `INSERT ... ON CONFLICT` statement is used if
+        supported by the database (values that were added concurrently are kept or replaced)
+
+        :param update_existing: replace the value of existing Template Values instead of keeping them
+        :return:
+        """
+        table = TemplateValue.__table__
+        if not supports_upsert(db.session):
+            return table.insert()
+
+        update_columns = ["value"] if update_existing else None
+        return upsert_statement(table, ["template_value_set_id", "var_name_slug"], update_columns)
+
     @property
     def var_name(self):
         return self.var_name_slug
@@ -56,6 +89,48 @@ class TemplateValue(db.Model):
         return '<TemplateValue %r>' % self.var_name
 
 
+def dump_packed_values(values):
+    """serialize the values of a Template Value Set for the packed storage
+
+    :param values: dictionary with the variable name as key and the value as value
+    :return:
+    """
+    return json.dumps(values, sort_keys=True, separators=(",", ":"))
+
+
+class PackedTemplateValue(object):
+    """
+    PackedTemplateValue
+    ===================
+
+    Template Value of a Template Value Set that uses the packed storage. It provides the same attributes as a
+    TemplateValue, the value is read from and written to the packed values of the Template Value Set.
+
+    """
+    id = None
+
+    def __init__(self, template_value_set, var_name):
+        self.template_value_set = template_value_set
+        self.var_name_slug = var_name
+
+    @property
+    def var_name(self):
+        return self.var_name_slug
+
+    @property
+    def value(self):
+        return self.template_value_set.get_packed_value_dict().get(self.var_name_slug)
+
+    @value.setter
+    def value(self, value):
+        values = dict(self.template_value_set.get_packed_value_dict())
+        values[self.var_name_slug] = value
+        self.template_value_set.store_packed_value_dict(values)
+
+    def __repr__(self):
+        return '<PackedTemplateValue %r>' % self.var_name
+
+
 class TemplateValueSet(db.Model):
     """
     TemplateValueSet
@@ -64,7 +139,11 @@ class TemplateValueSet(db.Model):
     The Template Value Set is used to store a set of variables for a Config Template.
 
     """
-    __table_args__ = (db.UniqueConstraint('hostname', 'config_template_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('hostname', 'config_template_id'),
+        # the Template Value Sets are loaded per Config Template and ordered by hostname
+        db.Index('ix_template_value_set_config_template_id_hostname', 'config_template_id', 'hostname'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     hostname = db.Column(
@@ -73,14 +152,39 @@ class TemplateValueSet(db.Model):
         nullable=False
     )
 
-    config_template_id = db.Column(db.Integer, db.ForeignKey('config_template.id'), nullable=False)
+    # changed whenever a Template Value of the set is written, used to invalidate the rendered configuration
+    revision = db.Column(db.String(32))
+
+    # JSON object with all values of the set, if the packed storage is used (otherwise the values are stored as
+    # TemplateValue rows)
+    packed_values = db.Column(db.UnicodeText())
+
+    config_template_id = db.Column(
+        db.Integer,
+        db.ForeignKey('config_template.id', ondelete="CASCADE"),
+        nullable=False
+    )
     config_template = db.relationship('ConfigTemplate', backref=db.backref('template_value_sets',
                                                                            cascade="all, delete-orphan",
+                                                                           passive_deletes=True,
                                                                            lazy='dynamic'))
 
-    def __init__(self, hostname, config_template=None):
+    # index of the Template Values by variable name within the session (built on first access, not persisted)
+    _value_index = None
+
+    # the decoded packed values and the string they were decoded from (not persisted)
+    _packed_value_cache = None
+
+    def __init__(self, hostname, config_template=None, packed=None):
         self.hostname = hostname
         self.config_template = config_template
+        self.bump_revision()
+
+        if packed is None:
+            packed = app.config["PACKED_TEMPLATE_VALUES"]
+
+        if packed:
+            self.store_packed_value_dict(dict())
 
         # if a config template is specified during the initial creation of the object, all defined variables are copied
         # to this value set
@@ -105,35 +209,121 @@ class TemplateValueSet(db.Model):
         return Slugify(separator="_", to_lower=False)(string)
 
     def copy_variables_from_config_template(self):
-        """this function copies all variables from the associated configuration template object
+        """this function copies all variables from the associated configuration template object. Existing values are
+        kept, the missing variables are added using a single bulk statement.
 
         :return:
         """
         if not self.config_template:
             raise ValueError("Config Template not set within the template value set, copy variable names not possible")
 
-        parent_vars = self.config_template.variables.all()
+        # the Template Value Set must be stored to reference it within the new Template Values
+        db.session.add(self)
+        db.session.flush()
+
+        parent_var_names = [
+            row.var_name_slug for row in db.session.query(TemplateVariable.var_name_slug).filter(
+                TemplateVariable.config_template_id == self.config_template_id
+            )
+        ]
+
+        if self.is_packed:
+            values = dict(self.get_packed_value_dict())
+            values["hostname"] = self.hostname
+            for var_name in parent_var_names:
+                values.setdefault(var_name, "")
+
+            self.store_packed_value_dict(values)
+            self.reset_value_index()
+            db.session.commit()
+            return
+
+        existing_var_names = set(
+            row.var_name_slug for row in db.session.query(TemplateValue.var_name_slug).filter(
+                TemplateValue.template_value_set_id == self.id
+            )
+        )
 
         # add hostname variable
-        self.update_variable_value("hostname", value=self.hostname)
+        if "hostname" in existing_var_names:
+            TemplateValue.query.filter(
+                TemplateValue.template_value_set_id == self.id,
+                TemplateValue.var_name_slug == "hostname"
+            ).update({"value": self.hostname}, synchronize_session="evaluate")
+
+        # existing values are kept, missing variables are added with an empty value
+        new_values = dict()
+        for var_name in ["hostname"] + parent_var_names:
+            if var_name not in existing_var_names:
+                new_values[var_name] = self.hostname if var_name == "hostname" else ""
+
+        if new_values:
+            db.session.execute(TemplateValue.new_values_statement(), [
+                {
+                    "var_name_slug": var_name,
+                    "value": value,
+                    "template_value_set_id": self.id
+                } for var_name, value in new_values.items()
+            ])
+
+        # the bulk statements are not tracked by the session
+        self.bump_revision()
+        self.reset_value_index()
+        db.session.commit()
+
+    @property
+    def is_packed(self):
+        return self.packed_values is not None
+
+    def get_packed_value_dict(self):
+        """get the values of a Template Value Set that uses the packed storage (decoded once per change)
+
+        :return: dictionary with the variable name as key and the value as value (must not be modified)
+        """
+        if self._packed_value_cache is None or self._packed_value_cache[0] is not self.packed_values:
+            values = json.loads(self.packed_values) if self.packed_values else dict()
+            self._packed_value_cache = (self.packed_values, values)
+        return self._packed_value_cache[1]
+
+    def store_packed_value_dict(self, values):
+        """replace the values of a Template Value Set that uses the packed storage (not committed)
+
+        :param values: dictionary with the variable name as key and the value as value
+        :return:
+        """
+        self.packed_values = dump_packed_values(values)
+        self._packed_value_cache = (self.packed_values, values)
+        self.bump_revision()
+
+    def get_value_index(self):
+        """get the index of the Template Values within the Template Value Set. The index is loaded on the first access
+        and kept in sync with the changes of the session.
+
+        :return: dictionary with the variable name as key and the TemplateValue (or PackedTemplateValue) as value
+        """
+        if self._value_index is None:
+            if self.is_packed:
+                self._value_index = dict(
+                    (var_name, PackedTemplateValue(self, var_name)) for var_name in self.get_packed_value_dict()
+                )
 
-        for tpl_var in parent_vars:
-            if self.is_value_defined(tpl_var.var_name):
-                old_value = self.get_template_value_by_name_as_string(tpl_var.var_name)
             else:
-                old_value = ""
+                self._value_index = dict((obj.var_name_slug, obj) for obj in self.values)
+        return self._value_index
 
-            self.update_variable_value(tpl_var.var_name, value=old_value)
+    def reset_value_index(self):
+        """drop the index of the Template Values, it is loaded again on the next access
+
+        :return:
+        """
+        self._value_index = None
 
     def get_template_value_names(self):
         """get all template variable names of the Template Value Set
 
         :return: a list of strings that contains all variable names
         """
-        result = []
-        for obj in self.values.all():
-            result.append(obj.var_name)
-        return result
+        return list(self.get_value_index().keys())
 
     def get_template_value_by_name(self, var_name):
         """get the Template Value by name within the Config Template, otherwise an TemplateValueNotFoundException is
@@ -144,7 +334,7 @@ class TemplateValueSet(db.Model):
         :param var_name: a variable name (always converted to a valid variable name)
         :return: the TemplateValue instance of the variable
         """
-        result = TemplateValue.query.filter_by(var_name_slug=var_name, template_value_set=self).first()
+        result = self.get_value_index().get(var_name)
         if not result:
             raise TemplateValueNotFoundException("Value for '%s' not found in "
                                                  "Template Value Set '%s'" % (var_name, self.hostname))
@@ -170,24 +360,72 @@ class TemplateValueSet(db.Model):
         :param auto_convert_var_name: enables or disables the automatic conversion of the variable names
         :return:
         """
-        # convert string
-        if auto_convert_var_name:
-            var_name = self.convert_variable_name(var_name)
+        return self.update_variable_values({var_name: value}, auto_convert_var_name=auto_convert_var_name)[0]
 
-        if var_name not in self.get_template_value_names():
-            # variable not found, create new one (automatic conversion is then enforced)
-            var_name = self.convert_variable_name(var_name)
-            new_var = TemplateValue(self, var_name, value)
-            db.session.add(new_var)
-            db.session.commit()
+    def update_variable_values(self, values, auto_convert_var_name=True):
+        """add or update multiple Template Variables for the Template Value set. The existing values are loaded once
+        and all changes are committed within a single transaction. The variable names are automatically converted to
+        slug strings.
 
-        else:
-            # update existing variable
-            tpl_var = TemplateValue.query.filter_by(var_name_slug=var_name, template_value_set=self).first()
-            tpl_var.value = value
-            db.session.commit()
+        :param values: dictionary with the variable name as key and the value as value
+        :param auto_convert_var_name: enables or disables the automatic conversion of the variable names
+        :return: list of the variable names that were updated (automatic conversion)
+        """
+        existing_values = self.get_value_index()
+        packed_values = dict(self.get_packed_value_dict()) if self.is_packed else None
+        # values that were added concurrently are replaced within the database
+        upsert = packed_values is None and supports_upsert(db.session)
 
-        return var_name
+        result = []
+        new_rows = []
+        for var_name, value in values.items():
+            # convert string
+            if auto_convert_var_name:
+                var_name = self.convert_variable_name(var_name)
+
+            if var_name not in existing_values:
+                # variable not found, create new one (automatic conversion is then enforced)
+                var_name = self.convert_variable_name(var_name)
+
+            if packed_values is not None:
+                packed_values[var_name] = value
+
+            elif var_name not in existing_values and upsert:
+                new_rows.append({
+                    "var_name_slug": var_name,
+                    "value": value
+                })
+
+            elif var_name not in existing_values:
+                new_var = TemplateValue(self, var_name, value)
+                db.session.add(new_var)
+
+            else:
+                # update existing variable
+                existing_values[var_name].value = value
+
+            result.append(var_name)
+
+        if packed_values is not None:
+            self.store_packed_value_dict(packed_values)
+            self.reset_value_index()
+
+        if new_rows:
+            # the Template Value Set must be stored to reference it within the new Template Values
+            db.session.add(self)
+            db.session.flush()
+            for row in new_rows:
+                row["template_value_set_id"] = self.id
+
+            db.session.execute(TemplateValue.new_values_statement(update_existing=True), new_rows)
+
+            # the bulk statements are not tracked by the session
+            self.bump_revision()
+            self.reset_value_index()
+
+        db.session.commit()
+
+        return result
 
     def is_value_defined(self, val_name):
         """checks if the given template value is defined on the Template Value Set
@@ -195,26 +433,120 @@ class TemplateValueSet(db.Model):
         :param val_name:
         :return:
         """
-        return val_name in self.get_template_value_names()
+        return val_name in self.get_value_index()
 
     def get_template_variables(self):
         """create a sorted list of the Template Values within this Template Value Set
 
         :return:
         """
+        if self.is_packed:
+            index = self.get_value_index()
+            return [index[var_name] for var_name in sorted(index.keys())]
+
         return self.values.order_by(TemplateValue.var_name_slug).all()
 
+    def get_template_value_dict(self):
+        """get all Template Values of the Template Value Set as dictionary
+
+        :return: dictionary with the variable name as key and the value as value
+        """
+        if self.is_packed:
+            return dict(self.get_packed_value_dict())
+
+        result = dict()
+        for val in self.values:
+            result[val.var_name] = val.value
+        return result
+
+    def set_packed_storage(self, packed=True):
+        """convert the values of the Template Value Set to the packed or the row storage
+
+        :param packed: use the packed storage
+        :return:
+        """
+        if packed == self.is_packed:
+            return
+
+        values = self.get_template_value_dict()
+        if packed:
+            TemplateValue.query.filter(
+                TemplateValue.template_value_set_id == self.id
+            ).delete(synchronize_session="fetch")
+            self.store_packed_value_dict(values)
+
+        else:
+            self.packed_values = None
+            self.bump_revision()
+            db.session.flush()
+            if values:
+                db.session.execute(TemplateValue.__table__.insert(), [
+                    {
+                        "var_name_slug": var_name,
+                        "value": value,
+                        "template_value_set_id": self.id
+                    } for var_name, value in values.items()
+                ])
+
+        self.reset_value_index()
+        db.session.commit()
+
+    def bump_revision(self):
+        """mark the Template Values of the set as changed, cached configurations of the set are not used anymore
+
+        :return:
+        """
+        self.revision = uuid.uuid4().hex
+
+    def _has_pending_deleted_values(self):
+        """check if Template Values of the set are deleted within the session but not flushed yet
+
+        :return:
+        """
+        for obj in db.session.deleted:
+            if isinstance(obj, TemplateValue) and obj.template_value_set_id == self.id:
+                return True
+
+        return False
+
+    def get_result_cache_key(self, template_hash):
+        """get the key of the rendered configuration within the rendered result cache
+
+        :param template_hash: hash of the template content of the Config Template
+        :return: the key or None, if the Template Value Set is not stored yet
+        """
+        if self.id is None or self.revision is None:
+            return None
+
+        return template_hash, self.id, self.revision
+
     def get_configuration_result(self):
-        """generates the configuration based on the Config Template and the associated Template Value Set
+        """generates the configuration based on the Config Template and the associated Template Value Set. The result
+        is cached until the Template Value Set or the template content is changed.
 
         :return:
         """
-        dcg = MakoConfigGenerator(template_string=self.config_template.template_content)
+        template_content = self.config_template.template_content
+        cache_key = None
+        if not self._has_pending_deleted_values():
+            # the revision is changed whenever a value is changed (deleted values are only tracked during the flush)
+            cache_key = self.get_result_cache_key(get_template_hash(template_content))
 
-        for val in self.values:
-            dcg.set_variable_value(val.var_name, val.value)
+        if cache_key:
+            result = rendered_result_cache.get(cache_key)
+            if result is not None:
+                return result
+
+        dcg = MakoConfigGenerator(template_string=template_content)
 
-        return dcg.get_rendered_result()
+        for var_name, value in self.get_template_value_dict().items():
+            dcg.set_variable_value(var_name, value)
+
+        result = dcg.get_rendered_result()
+        if cache_key:
+            rendered_result_cache.put(cache_key, result)
+
+        return result
 
 
 class TemplateVariable(db.Model):
@@ -234,11 +566,16 @@ class TemplateVariable(db.Model):
         index=True,
         nullable=False
     )
-    description = db.Column(db.String(4096), index=True)
+    description = db.Column(db.String(4096))
 
-    config_template_id = db.Column(db.Integer, db.ForeignKey('config_template.id'), nullable=False)
+    config_template_id = db.Column(
+        db.Integer,
+        db.ForeignKey('config_template.id', ondelete="CASCADE"),
+        nullable=False
+    )
     config_template = db.relationship('ConfigTemplate', backref=db.backref('variables',
                                                                            cascade="all, delete-orphan",
+                                                                           passive_deletes=True,
                                                                            lazy='dynamic'))
 
     @property
@@ -275,15 +612,19 @@ class ConfigTemplate(db.Model):
         index=True,
         nullable=False
     )
-    _template_content = db.Column(db.UnicodeText(), index=True)
+    _template_content = db.Column(db.UnicodeText())
 
-    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete="CASCADE"), nullable=False)
     project = db.relationship('Project', backref=db.backref('configtemplates',
                                                             cascade="all, delete-orphan",
+                                                            passive_deletes=True,
                                                             lazy='dynamic'))
     last_successful_ftp_export = db.Column(db.DateTime)
     last_successful_tftp_export = db.Column(db.DateTime)
 
+    # index of the Template Variables by name within the session (built on first access, not persisted)
+    _variable_index = None
+
     @property
     def name_slug(self):
         return Slugify(to_lower=False)(self.name)
@@ -294,14 +635,7 @@ class ConfigTemplate(db.Model):
 
     @template_content.setter
     def template_content(self, value):
-        # if the template content is changed, drop all associated Template Value Sets
-        if self._template_content != value:
-            for obj in self.template_value_sets.all():
-                TemplateValueSet.query.filter(TemplateValueSet.id == obj.id).delete()
-
-        self._template_content = value
-
-        self._create_variables_from_template_content()
+        self.update_template_content(value)
 
     def __init__(self, name, project=None, template_content=""):
         self.name = name
@@ -326,40 +660,274 @@ class ConfigTemplate(db.Model):
         """
         return Slugify(separator="_", to_lower=False)(string)
 
+    def _get_variable_names_from_template_content(self, template_content):
+        """get the converted names of all variables that are used within the given template content
+
+        :param template_content:
+        :return: list of variable names (in order of the template variables)
+        """
+        dcg = MakoConfigGenerator(template_string=template_content or "")
+        result = []
+        for var_name in dcg.template_variables:
+            var_name = self.convert_variable_name(var_name)
+            if var_name not in result:
+                result.append(var_name)
+        return result
+
+    def update_template_content(self, value, keep_values=None):
+        """change the template content of the Config Template. If the content is changed, the variables of the old and
+        the new template content are reconciled within the associated Template Value Sets: existing values are kept,
+        empty values are added for new variables and the values of removed variables are deleted using bulk
+        statements. If `keep_values` is disabled, all associated Template Value Sets are deleted instead.
+
+        :param value: the new template content
+        :param keep_values: reconcile the values of the associated Template Value Sets instead of deleting them (None
+                            to use the `RECONCILE_TEMPLATE_VALUES` setting)
+        :return:
+        """
+        if keep_values is None:
+            keep_values = app.config["RECONCILE_TEMPLATE_VALUES"]
+
+        old_value = self._template_content
+        self._template_content = value
+
+        # the Config Template must be stored to reference it within the new Template Variables
+        db.session.add(self)
+        db.session.flush()
+
+        if old_value is not None and old_value != value:
+            if keep_values:
+                old_var_names = set(self._get_variable_names_from_template_content(old_value))
+                new_var_names = set(self._get_variable_names_from_template_content(value))
+
+                # the hostname is part of every Template Value Set
+                self._delete_template_variables(old_var_names - new_var_names - {"hostname"})
+                self._create_variables_from_template_content()
+                self._add_empty_template_values(new_var_names - old_var_names - {"hostname"})
+
+            else:
+                self._delete_template_value_sets()
+                self._create_variables_from_template_content()
+
+        else:
+            self._create_variables_from_template_content()
+
+        db.session.commit()
+
+    def _template_value_set_ids(self):
+        """subquery that selects the IDs of all Template Value Sets of the Config Template
+
+        :return:
+        """
+        return db.session.query(TemplateValueSet.id).filter(TemplateValueSet.config_template_id == self.id).subquery()
+
+    def _bump_template_value_set_revisions(self):
+        """change the revision of all Template Value Sets of the Config Template using a single bulk statement
+
+        :return:
+        """
+        TemplateValueSet.query.filter(TemplateValueSet.config_template_id == self.id).update(
+            {"revision": uuid.uuid4().hex},
+            synchronize_session="evaluate"
+        )
+
+    def _update_packed_value_sets(self, update_function):
+        """change the values of all Template Value Sets of the Config Template, that use the packed storage. The
+        changed values are written using a single bulk statement.
+
+        :param update_function: function that modifies the given dictionary of values and returns True if it was
+                                changed
+        :return:
+        """
+        changed_rows = []
+        for row in db.session.query(TemplateValueSet.id, TemplateValueSet.packed_values).filter(
+            TemplateValueSet.config_template_id == self.id,
+            TemplateValueSet.packed_values.isnot(None)
+        ):
+            values = json.loads(row.packed_values)
+            if update_function(values):
+                changed_rows.append({
+                    "value_set_id": row.id,
+                    "new_packed_values": dump_packed_values(values)
+                })
+
+        if not changed_rows:
+            return
+
+        table = TemplateValueSet.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam("value_set_id")).values(
+                packed_values=bindparam("new_packed_values")
+            ),
+            changed_rows
+        )
+
+        # the bulk statement is not tracked by the session
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, TemplateValueSet) and obj.config_template_id == self.id:
+                db.session.expire(obj, ["packed_values"])
+                obj.reset_value_index()
+
+    def _delete_template_variables(self, var_names):
+        """delete the given Template Variables and the associated values of all Template Value Sets using bulk
+        statements
+
+        :param var_names: names of the variables that should be deleted
+        :return:
+        """
+        if not var_names:
+            return
+
+        TemplateValue.query.filter(
+            TemplateValue.template_value_set_id.in_(self._template_value_set_ids()),
+            TemplateValue.var_name_slug.in_(var_names)
+        ).delete(synchronize_session="fetch")
+        TemplateVariable.query.filter(
+            TemplateVariable.config_template_id == self.id,
+            TemplateVariable.var_name_slug.in_(var_names)
+        ).delete(synchronize_session="fetch")
+
+        def delete_packed_values(values):
+            deleted_var_names = [var_name for var_name in values.keys() if var_name in var_names]
+            for var_name in deleted_var_names:
+                del values[var_name]
+            return len(deleted_var_names) > 0
+
+        self._update_packed_value_sets(delete_packed_values)
+        self._bump_template_value_set_revisions()
+
+    def _add_empty_template_values(self, var_names):
+        """add an empty value for the given variables to all Template Value Sets of the Config Template using a single
+        bulk statement (existing values are kept)
+
+        :param var_names: names of the variables that should be added
+        :return:
+        """
+        if not var_names:
+            return
+
+        existing_value = db.session.query(TemplateValue.id).filter(
+            TemplateValue.template_value_set_id == TemplateValueSet.id,
+            TemplateValue.var_name_slug == TemplateVariable.var_name_slug
+        ).exists()
+        new_values = db.session.query(
+            TemplateVariable.var_name_slug,
+            literal(""),
+            TemplateValueSet.id
+        ).join(
+            TemplateValueSet, TemplateValueSet.config_template_id == TemplateVariable.config_template_id
+        ).filter(
+            TemplateVariable.config_template_id == self.id,
+            TemplateVariable.var_name_slug.in_(var_names),
+            ~existing_value
+        )
+        db.session.execute(TemplateValue.new_values_statement().from_select(
+            ["var_name_slug", "value", "template_value_set_id"],
+            new_values.statement.where(TemplateValueSet.packed_values.is_(None))
+        ))
+        reset_variable_name_indexes(db.session)
+
+        def add_packed_values(values):
+            new_var_names = [var_name for var_name in var_names if var_name not in values]
+            for var_name in new_var_names:
+                values[var_name] = ""
+            return len(new_var_names) > 0
+
+        self._update_packed_value_sets(add_packed_values)
+        self._bump_template_value_set_revisions()
+
+    def _delete_template_value_sets(self):
+        """delete all Template Value Sets of the Config Template including their values using bulk statements
+
+        :return:
+        """
+        TemplateValue.query.filter(
+            TemplateValue.template_value_set_id.in_(self._template_value_set_ids())
+        ).delete(synchronize_session="fetch")
+        TemplateValueSet.query.filter(
+            TemplateValueSet.config_template_id == self.id
+        ).delete(synchronize_session="fetch")
+
     def _create_variables_from_template_content(self):
-        dcg = MakoConfigGenerator(template_string=self.template_content)
+        """create the Template Variables that are used within the template content. The parsed variable names are
+        compared with the stored ones and the missing variables are added using a single bulk statement (the
+        transaction is not committed).
 
-        # the hostname is always defined within a TemplateValueSet, add it with a default description
-        self.update_template_variable(
-            "hostname",
-            "the hostname of the device (also used as name for the template value set)"
+        :return:
+        """
+        stored_var_names = set(
+            row.var_name_slug for row in db.session.query(TemplateVariable.var_name_slug).filter(
+                TemplateVariable.config_template_id == self.id
+            )
         )
 
+        # the hostname is always defined within a TemplateValueSet, add it with a default description
+        new_variables = OrderedDict()
+        new_variables["hostname"] = "the hostname of the device (also used as name for the template value set)"
+
         # create new template variables on the Config Template
-        for var_name in dcg.template_variables:
-            if var_name != "hostname":
-                self.update_template_variable(var_name)
+        for var_name in self._get_variable_names_from_template_content(self.template_content):
+            if var_name not in new_variables:
+                new_variables[var_name] = ""
+
+        rows = [
+            {
+                "var_name_slug": var_name,
+                "description": description,
+                "config_template_id": self.id
+            } for var_name, description in new_variables.items() if var_name not in stored_var_names
+        ]
+        if rows:
+            db.session.execute(TemplateVariable.__table__.insert(), rows)
+            self.reset_variable_index()
 
     def rename_variable(self, old_name, new_name):
-        """rename the Template Variables within the Config Template and all associated Template Value Sets
+        """rename the Template Variables within the Config Template and all associated Template Value Sets. The values
+        are renamed using bulk statements within one transaction, existing values with the new name are overwritten.
 
         :param old_name:
         :param new_name:
         :return:
         """
-        if old_name not in self.get_template_variable_names():
+        if old_name not in self.get_variable_index():
             raise TemplateVariableNotFoundException("Variable %s not found in config template" % old_name)
 
         var_obj = self.get_template_variable_by_name(old_name)
         var_obj.var_name = new_name
+        new_name = var_obj.var_name
+        if new_name == old_name:
+            return
+
+        db.session.flush()
+
+        # existing values with the new name are overwritten by the renamed values
+        renamed_value = aliased(TemplateValue)
+        TemplateValue.query.filter(
+            TemplateValue.template_value_set_id.in_(self._template_value_set_ids()),
+            TemplateValue.var_name_slug == new_name,
+            db.session.query(renamed_value.id).filter(
+                renamed_value.template_value_set_id == TemplateValue.template_value_set_id,
+                renamed_value.var_name_slug == old_name
+            ).exists()
+        ).delete(synchronize_session="fetch")
 
         # variable renamed, change associated value sets
-        for valueset in self.template_value_sets.all():
-            old_val = valueset.get_template_value_by_name_as_string(old_name)
-            # drop old variable from value set
-            db.session.delete(valueset.get_template_value_by_name(old_name))
-            # create new variables with the new name and the old value
-            valueset.update_variable_value(var_name=new_name, value=old_val)
+        TemplateValue.query.filter(
+            TemplateValue.template_value_set_id.in_(self._template_value_set_ids()),
+            TemplateValue.var_name_slug == old_name
+        ).update({"var_name_slug": new_name}, synchronize_session="fetch")
+
+        def rename_packed_value(values):
+            if old_name not in values:
+                return False
+            values[new_name] = values.pop(old_name)
+            return True
+
+        self._update_packed_value_sets(rename_packed_value)
+
+        # Template Value Sets without a value for the variable get an empty one
+        self._add_empty_template_values({new_name})
+        db.session.commit()
 
     def valid_template_value_set_name(self, template_value_set_name):
         """test if the given Template Value Set name is valid within the Config Template
@@ -383,15 +951,29 @@ class ConfigTemplate(db.Model):
 
         return valid
 
+    def get_variable_index(self):
+        """get the index of the Template Variables within the Config Template. The index is loaded on the first access
+        and kept in sync with the changes of the session.
+
+        :return: dictionary with the variable name as key and the TemplateVariable as value
+        """
+        if self._variable_index is None:
+            self._variable_index = dict((obj.var_name_slug, obj) for obj in self.variables)
+        return self._variable_index
+
+    def reset_variable_index(self):
+        """drop the index of the Template Variables, it is loaded again on the next access
+
+        :return:
+        """
+        self._variable_index = None
+
     def get_template_variable_names(self):
         """get all Template Variable Names of the Config Template
 
         :return:
         """
-        result = []
-        for obj in self.variables.all():
-            result.append(obj.var_name)
-        return result
+        return list(self.get_variable_index().keys())
 
     def get_template_variable_by_name(self, var_name):
         """get a Template Variable by the var_name_slug attribute within the Config Template
@@ -399,7 +981,7 @@ class ConfigTemplate(db.Model):
         :param var_name:
         :return:
         """
-        result = TemplateVariable.query.filter_by(var_name_slug=var_name, config_template=self).first()
+        result = self.get_variable_index().get(var_name)
         if not result:
             raise TemplateVariableNotFoundException("Variable '%s' not found in Template '%s'" % (var_name, self.name))
         return result
@@ -416,7 +998,7 @@ class ConfigTemplate(db.Model):
         if auto_convert_var_name:
             var_name = self.convert_variable_name(var_name)
 
-        if var_name not in self.get_template_variable_names():
+        if var_name not in self.get_variable_index():
             # variable not found, create new one (automatic conversion is then enforced)
             var_name = self.convert_variable_name(var_name)
             new_var = TemplateVariable(self, var_name, description)
@@ -425,7 +1007,7 @@ class ConfigTemplate(db.Model):
 
         else:
             # update existing variable
-            tpl_var = TemplateVariable.query.filter_by(var_name_slug=var_name, config_template=self).first()
+            tpl_var = self.get_variable_index()[var_name]
             tpl_var.description = description
             db.session.commit()
 
@@ -437,7 +1019,218 @@ class ConfigTemplate(db.Model):
         :param var_name:
         :return:
         """
-        return var_name in self.get_template_variable_names()
+        return var_name in self.get_variable_index()
+
+    def iter_template_value_dicts(self, yield_per=None, template_value_set_ids=None):
+        """load the values of all Template Value Sets of the Config Template using a single query, ordered by the ID
+        of the Template Value Set (Template Value Sets that use the packed storage are read from a single row)
+
+        :param yield_per: fetch the rows in chunks of the given size instead of loading the entire result at once
+                          (None or 0 to disable)
+        :param template_value_set_ids: load only the Template Value Sets with the given IDs (None to load all)
+        :return: generator of (Template Value Set ID, hostname, dictionary with the variable name as key and the value
+                 as value) tuples
+        """
+        query = db.session.query(
+            TemplateValueSet.id,
+            TemplateValueSet.hostname,
+            TemplateValueSet.packed_values,
+            TemplateValue.var_name_slug,
+            TemplateValue.value
+        ).outerjoin(
+            TemplateValue, TemplateValue.template_value_set_id == TemplateValueSet.id
+        ).filter(
+            TemplateValueSet.config_template_id == self.id
+        ).order_by(TemplateValueSet.id)
+
+        if template_value_set_ids is not None:
+            query = query.filter(TemplateValueSet.id.in_(template_value_set_ids))
+
+        if yield_per:
+            query = query.yield_per(yield_per)
+
+        for (template_value_set_id, hostname, packed_values), rows in itertools.groupby(
+            query, key=lambda row: (row[0], row[1], row[2])
+        ):
+            if packed_values is not None:
+                # a single row without Template Values
+                values = json.loads(packed_values)
+
+            else:
+                values = dict((row.var_name_slug, row.value) for row in rows if row.var_name_slug is not None)
+
+            yield template_value_set_id, hostname, values
+
+    def get_template_value_dicts(self, yield_per=None):
+        """load the values of all Template Value Sets of the Config Template using a single query
+
+        :param yield_per: fetch the rows in chunks of the given size (None or 0 to disable)
+        :return: dictionary with the hostname as key and a dictionary of the values as value
+        """
+        return OrderedDict(
+            (hostname, values) for _, hostname, values in self.iter_template_value_dicts(yield_per=yield_per)
+        )
+
+    def get_template_value_set_page(self, after_hostname=None, hostname_prefix=None, per_page=100):
+        """load a page of Template Value Sets ordered by hostname including their values (keyset pagination, the next
+        page starts after the last hostname of the previous page)
+
+        :param after_hostname: return only Template Value Sets with a greater hostname (None for the first page)
+        :param hostname_prefix: return only Template Value Sets whose hostname starts with the given string (case
+                                sensitive)
+        :param per_page: maximum number of Template Value Sets on the page
+        :return: tuple of a list of (Template Value Set ID, hostname, dictionary with the variable name as key and the
+                 value as value) tuples and the hostname that is used to request the next page (None on the last page)
+        """
+        if per_page < 1:
+            raise ValueError("per page must be greater than 0")
+
+        query = db.session.query(TemplateValueSet.id, TemplateValueSet.hostname).filter(
+            TemplateValueSet.config_template_id == self.id
+        )
+
+        if after_hostname:
+            query = query.filter(TemplateValueSet.hostname > after_hostname)
+
+        if hostname_prefix:
+            hostname = TemplateValueSet.hostname
+            if db.session.get_bind().dialect.name == "postgresql":
+                # the range condition is only valid for a binary comparison (independent of the database collation)
+                hostname = hostname.collate('"C"')
+
+            escaped_prefix = hostname_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.filter(
+                TemplateValueSet.hostname.like(escaped_prefix + "%", escape="\\"),
+                # range condition, that uses the index on the hostname (LIKE is case insensitive on SQLite)
+                hostname >= hostname_prefix
+            )
+
+            # no upper bound exists for a prefix that ends with the last code point
+            if ord(hostname_prefix[-1]) < sys.maxunicode:
+                query = query.filter(hostname < hostname_prefix[:-1] + chr(ord(hostname_prefix[-1]) + 1))
+
+        rows = query.order_by(TemplateValueSet.hostname).limit(per_page + 1).all()
+        next_hostname = rows[per_page - 1].hostname if len(rows) > per_page else None
+        rows = rows[:per_page]
+
+        values = dict()
+        if rows:
+            for template_value_set_id, _, value_dict in self.iter_template_value_dicts(
+                template_value_set_ids=[row.id for row in rows]
+            ):
+                values[template_value_set_id] = value_dict
+
+        return [(row.id, row.hostname, values.get(row.id, dict())) for row in rows], next_hostname
+
+    def set_packed_storage(self, packed=True):
+        """convert the values of all Template Value Sets of the Config Template to the packed or the row storage using
+        bulk statements
+
+        :param packed: use the packed storage
+        :return: number of converted Template Value Sets
+        """
+        db.session.flush()
+
+        table = TemplateValueSet.__table__
+        if packed:
+            row_storage_ids = set(
+                row.id for row in db.session.query(TemplateValueSet.id).filter(
+                    TemplateValueSet.config_template_id == self.id,
+                    TemplateValueSet.packed_values.is_(None)
+                )
+            )
+            converted_rows = [
+                {
+                    "value_set_id": template_value_set_id,
+                    "new_packed_values": dump_packed_values(values)
+                } for template_value_set_id, _, values in self.iter_template_value_dicts()
+                if template_value_set_id in row_storage_ids
+            ]
+            if converted_rows:
+                db.session.execute(
+                    table.update().where(table.c.id == bindparam("value_set_id")).values(
+                        packed_values=bindparam("new_packed_values")
+                    ),
+                    converted_rows
+                )
+                TemplateValue.query.filter(
+                    TemplateValue.template_value_set_id.in_(self._template_value_set_ids())
+                ).delete(synchronize_session="fetch")
+
+        else:
+            converted_rows = db.session.query(TemplateValueSet.id, TemplateValueSet.packed_values).filter(
+                TemplateValueSet.config_template_id == self.id,
+                TemplateValueSet.packed_values.isnot(None)
+            ).all()
+            new_values = []
+            for row in converted_rows:
+                for var_name, value in json.loads(row.packed_values).items():
+                    new_values.append({
+                        "var_name_slug": var_name,
+                        "value": value,
+                        "template_value_set_id": row.id
+                    })
+
+            if new_values:
+                db.session.execute(TemplateValue.__table__.insert(), new_values)
+
+            if converted_rows:
+                db.session.execute(table.update().where(table.c.config_template_id == self.id).values(
+                    packed_values=None
+                ))
+
+        # the bulk statements are not tracked by the session
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, TemplateValueSet) and obj.config_template_id == self.id:
+                db.session.expire(obj, ["packed_values"])
+
+        self._bump_template_value_set_revisions()
+        reset_variable_name_indexes(db.session)
+        db.session.commit()
+
+        return len(converted_rows)
+
+    def get_configuration_results(self, processes=0, threads=0, yield_per=None):
+        """generates the configurations for all Template Value Sets of the Config Template. The template is compiled
+        only once and a rendering error is returned per Template Value Set (see MakoConfigGenerator.render_many).
+        Only the Template Value Sets without a cached result are rendered, the values are loaded using a single query.
+
+        :param processes: number of worker processes that are used to render the configurations (0 to disable)
+        :param threads: number of threads that are used to render the configurations (0 to disable)
+        :param yield_per: fetch the values in chunks of the given size (None or 0 to disable)
+        :return: generator of (TemplateValueSet, RenderResult) tuples
+        """
+        template_value_sets = self.template_value_sets.order_by(TemplateValueSet.id).all()
+        template_hash = get_template_hash(self.template_content)
+        cache_keys = [tvs.get_result_cache_key(template_hash) for tvs in template_value_sets]
+        cached_results = [rendered_result_cache.get(key) if key else None for key in cache_keys]
+
+        def iter_variable_dicts():
+            # both sequences are ordered by the ID of the Template Value Set
+            value_dicts = self.iter_template_value_dicts(yield_per=yield_per)
+            current = next(value_dicts, None)
+            for tvs, cached_result in zip(template_value_sets, cached_results):
+                if cached_result is not None:
+                    continue
+
+                while current is not None and current[0] < tvs.id:
+                    current = next(value_dicts, None)
+
+                yield current[2] if current is not None and current[0] == tvs.id else dict()
+
+        dcg = MakoConfigGenerator(template_string=self.template_content)
+        results = dcg.render_many(iter_variable_dicts(), processes=processes, threads=threads)
+
+        for tvs, cache_key, cached_result in zip(template_value_sets, cache_keys, cached_results):
+            if cached_result is not None:
+                yield tvs, RenderResult(cached_result, None)
+
+            else:
+                render_result = next(results)
+                if cache_key and not render_result.error:
+                    rendered_result_cache.put(cache_key, render_result.result)
+
+                yield tvs, render_result
 
 
 class Project(db.Model):
@@ -486,3 +1279,202 @@ class Project(db.Model):
                 break
 
         return valid
+
+
+class ProjectDataRevision(db.Model):
+    """
+    Project Data Revision
+    =====================
+
+    Single row with a counter that is incremented whenever a Project or Config Template is changed, used to detect
+    changes of other processes (e.g. for the cached sidebar data).
+
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+
+    ROW_ID = 1
+
+    @classmethod
+    def get_revision(cls, session):
+        """get the current revision of the Projects and Config Templates
+
+        :param session:
+        :return:
+        """
+        return session.query(cls.revision).filter(cls.id == cls.ROW_ID).scalar() or 0
+
+    @classmethod
+    def increment(cls, session):
+        """increment the revision within the current transaction of the session (or connection)
+
+        :param session:
+        :return:
+        """
+        table = cls.__table__
+        if supports_upsert(session):
+            # creates the row if it is missing (e.g. if the table was created by a database migration)
+            statement = postgresql.insert(table).values(id=cls.ROW_ID, revision=1)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={"revision": table.c.revision + 1}
+            ))
+            return
+
+        # the write transactions on SQLite are serialized, the row cannot be inserted concurrently
+        result = session.execute(table.update().where(table.c.id == cls.ROW_ID).values(revision=table.c.revision + 1))
+        if result.rowcount == 0:
+            session.execute(table.insert().values(id=cls.ROW_ID, revision=1))
+
+
+@event.listens_for(ProjectDataRevision.__table__, "after_create")
+def seed_project_data_revision(target, connection, **kw):
+    """insert the single row of the Project Data Revision when the table is created
+
+    :param target: table of the Project Data Revision
+    :param connection:
+    :param kw:
+    :return:
+    """
+    connection.execute(target.insert().values(id=ProjectDataRevision.ROW_ID, revision=0))
+
+
+@event.listens_for(Session, "before_flush")
+def bump_template_value_set_revisions(session, flush_context, instances):
+    """change the revision of all Template Value Sets, that contain deleted Template Values (changed and new values
+    change the revision immediately)
+
+    :param session:
+    :param flush_context:
+    :param instances:
+    :return:
+    """
+    for obj in session.deleted:
+        if isinstance(obj, TemplateValue):
+            template_value_set = obj.template_value_set
+            if template_value_set is not None and template_value_set not in session.deleted:
+                template_value_set.bump_revision()
+
+
+@event.listens_for(TemplateValue.value, "set")
+@event.listens_for(TemplateValue.var_name_slug, "set")
+def bump_template_value_set_revision_on_change(target, value, oldvalue, initiator):
+    """change the revision of the Template Value Set, if a value is changed (cached results are not used anymore)
+
+    :param target:
+    :param value:
+    :param oldvalue:
+    :param initiator:
+    :return:
+    """
+    if value == oldvalue:
+        return
+
+    # the Template Value Set may be loaded, the pending change is not flushed
+    with db.session.no_autoflush:
+        template_value_set = target.template_value_set
+
+    if template_value_set is not None:
+        template_value_set.bump_revision()
+
+
+@event.listens_for(TemplateValue.template_value_set, "set")
+def bump_template_value_set_revision_on_move(target, value, oldvalue, initiator):
+    """change the revision of the Template Value Sets, if a value is added or removed
+
+    :param target:
+    :param value:
+    :param oldvalue:
+    :param initiator:
+    :return:
+    """
+    for template_value_set in (value, oldvalue):
+        if isinstance(template_value_set, TemplateValueSet) and value is not oldvalue:
+            template_value_set.bump_revision()
+
+
+def reset_variable_name_indexes(session):
+    """drop the variable name indexes of all Config Templates and Template Value Sets within the session, used if
+    the variables are changed by bulk statements that are not tracked by the session or if the transaction ends
+    (the variables may be changed by other sessions afterwards)
+
+    :param session:
+    :return:
+    """
+    for obj in list(session.identity_map.values()) + list(session.new):
+        if isinstance(obj, TemplateValueSet):
+            obj.reset_value_index()
+
+        elif isinstance(obj, ConfigTemplate):
+            obj.reset_variable_index()
+
+
+@event.listens_for(Session, "after_rollback")
+def reset_variable_name_indexes_after_rollback(session):
+    reset_variable_name_indexes(session)
+
+
+@event.listens_for(Session, "after_commit")
+def reset_variable_name_indexes_after_commit(session):
+    reset_variable_name_indexes(session)
+
+
+@event.listens_for(Session, "after_bulk_update")
+def reset_variable_name_indexes_after_bulk_update(update_context):
+    reset_variable_name_indexes(update_context.session)
+
+
+@event.listens_for(Session, "after_bulk_delete")
+def reset_variable_name_indexes_after_bulk_delete(delete_context):
+    reset_variable_name_indexes(delete_context.session)
+
+
+@event.listens_for(Session, "before_flush")
+def remove_deleted_variables_from_indexes(session, flush_context, instances):
+    """remove the deleted Template Values and Template Variables from the variable name indexes
+
+    :param session:
+    :param flush_context:
+    :param instances:
+    :return:
+    """
+    for obj in session.deleted:
+        if isinstance(obj, TemplateValue):
+            parent = obj.template_value_set
+            if parent is not None and parent._value_index is not None:
+                parent._value_index.pop(obj.var_name_slug, None)
+
+        elif isinstance(obj, TemplateVariable):
+            parent = obj.config_template
+            if parent is not None and parent._variable_index is not None:
+                parent._variable_index.pop(obj.var_name_slug, None)
+
+
+@event.listens_for(TemplateValue.template_value_set, "set")
+def add_template_value_to_index(target, value, oldvalue, initiator):
+    if isinstance(oldvalue, TemplateValueSet):
+        oldvalue.reset_value_index()
+
+    if value is not None and value._value_index is not None:
+        value._value_index[target.var_name_slug] = target
+
+
+@event.listens_for(TemplateVariable.config_template, "set")
+def add_template_variable_to_index(target, value, oldvalue, initiator):
+    if isinstance(oldvalue, ConfigTemplate):
+        oldvalue.reset_variable_index()
+
+    if value is not None and value._variable_index is not None:
+        value._variable_index[target.var_name_slug] = target
+
+
+@event.listens_for(TemplateValue.var_name_slug, "set")
+@event.listens_for(TemplateVariable.var_name_slug, "set")
+def reset_index_on_rename(target, value, oldvalue, initiator):
+    # only the already loaded parent objects are updated
+    parent = target.__dict__.get("template_value_set", target.__dict__.get("config_template"))
+    if isinstance(parent, TemplateValueSet):
+        parent.reset_value_index()
+
+    elif isinstance(parent, ConfigTemplate):
+        parent.reset_variable_index()
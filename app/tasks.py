@@ -1,13 +1,25 @@
 import datetime
+import os
 import time
 import logging
-from app import celery, db
+from celery.signals import worker_process_init
+from app import app, celery, db
 from app.models import ConfigTemplate
-from app.utils.export import export_configuration_to_local_ftp, export_configuration_to_local_tftp
+from app.utils.csv_import import import_template_value_sets_from_csv
+from app.utils.export import export_config_template_to_local_ftp, export_config_template_to_local_tftp
 
 logger = logging.getLogger("tasks")
 
 
+@worker_process_init.connect
+def dispose_database_connections(**kwargs):
+    """
+    the pooled database connections of the parent process are not shared with the forked worker processes
+    :return:
+    """
+    db.engine.dispose()
+
+
 @celery.task()
 def debug_celery_task(a, b):
     """
@@ -33,12 +45,20 @@ def update_local_ftp_configurations(config_template_id):
     try:
         config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
 
-        for tvs in config_template.template_value_sets:
-            export_configuration_to_local_ftp(tvs)
+        export_result = export_config_template_to_local_ftp(config_template)
+        result["written"] = export_result["written"]
+        result["skipped"] = export_result["skipped"]
+        result["removed"] = export_result["removed"]
+
+        if export_result["errors"]:
+            result["error"] = "failed to render configuration for %s" % ", ".join(
+                sorted(export_result["errors"].keys())
+            )
 
-        config_template.last_successful_ftp_export = datetime.datetime.now()
-        db.session.commit()
-        result["timestamp"] = config_template.last_successful_ftp_export.strftime('%Y/%m/%d %H:%M')
+        else:
+            config_template.last_successful_ftp_export = datetime.datetime.now()
+            db.session.commit()
+            result["timestamp"] = config_template.last_successful_ftp_export.strftime('%Y/%m/%d %H:%M')
 
     except Exception as ex:
         logger.error("failed to update local FTP configuration files", exc_info=True)
@@ -59,15 +79,74 @@ def update_local_tftp_configurations(config_template_id):
     try:
         config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
 
-        for tvs in config_template.template_value_sets:
-            export_configuration_to_local_tftp(tvs)
+        export_result = export_config_template_to_local_tftp(config_template)
+        result["written"] = export_result["written"]
+        result["skipped"] = export_result["skipped"]
+        result["removed"] = export_result["removed"]
+
+        if export_result["errors"]:
+            result["error"] = "failed to render configuration for %s" % ", ".join(
+                sorted(export_result["errors"].keys())
+            )
 
-        config_template.last_successful_tftp_export = datetime.datetime.now()
-        db.session.commit()
-        result["timestamp"] = config_template.last_successful_tftp_export.strftime('%Y/%m/%d %H:%M')
+        else:
+            config_template.last_successful_tftp_export = datetime.datetime.now()
+            db.session.commit()
+            result["timestamp"] = config_template.last_successful_tftp_export.strftime('%Y/%m/%d %H:%M')
 
     except Exception as ex:
         logger.error("failed to update local TFTP configuration files", exc_info=True)
         result["error"] = str(ex)
 
     return result
+
+
+@celery.task(bind=True)
+def import_template_value_sets_from_csv_file(self, config_template_id, csv_file_path):
+    """
+    import the Template Value Sets of a config template from an uploaded CSV file, the progress is reported using the
+    `PROGRESS` state. The CSV file is removed afterwards.
+    :param config_template_id:
+    :param csv_file_path:
+    :return:
+    """
+    # if the result contains a "error" key, the task is failed
+    result = {}
+
+    def update_progress(processed_lines):
+        self.update_state(state="PROGRESS", meta={
+            "status": "%d lines processed" % processed_lines,
+            "processed": processed_lines
+        })
+
+    try:
+        config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+
+        with open(csv_file_path, encoding="utf-8", newline="") as csv_file:
+            import_result = import_template_value_sets_from_csv(
+                config_template,
+                csv_file,
+                batch_size=app.config["CSV_IMPORT_BATCH_SIZE"],
+                progress_callback=update_progress
+            )
+
+        result["created"] = len(import_result["created"])
+        result["updated"] = len(import_result["updated"])
+        result["status"] = "%d Template Value Sets created, %d updated" % (result["created"], result["updated"])
+
+        errors = [message for message, category in import_result["messages"] if category == "error"]
+        if errors:
+            result["error"] = "; ".join(errors)
+
+    except Exception as ex:
+        logger.error("failed to import the CSV file", exc_info=True)
+        result["error"] = str(ex)
+
+    finally:
+        try:
+            os.remove(csv_file_path)
+
+        except OSError:
+            logger.warning("unable to remove the CSV file %s" % csv_file_path, exc_info=True)
+
+    return result
@@ -1,8 +1,17 @@
 """
 Mako based Configuration Generator
 """
+import hashlib
+import itertools
 import logging
+import os
 import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
 from mako.exceptions import CompileException, SyntaxException
 from mako.template import Template
@@ -17,18 +26,356 @@ class TemplateSyntaxException(BaseException):
     pass
 
 
+def get_template_hash(template_string):
+    """create a hash value of the given template content, that is used as key within the template caches
+
+    :param template_string:
+    :return: hex digest of the template content
+    """
+    return hashlib.sha1(template_string.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    thread-safe and size-bounded least recently used cache with hit and miss counters
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """get the cached value for the given key, returns None if the key is not cached
+
+        :param key:
+        :return:
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """add or replace a value in the cache, the least recently used entries are dropped if the cache is full
+
+        :param key:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > max(self.maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """drop all entries and reset the counters
+
+        :return:
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """get the statistics of the cache
+
+        :return: dictionary with the hits, misses, current size and maximum size of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize
+            }
+
+
+class CompiledTemplateCache(LRUCache):
+    """
+    process-wide cache for compiled Mako templates, keyed by the hash of the template content
+
+    If a module directory is defined, the Python modules that are generated by Mako are stored on disk (named by the
+    template hash), so that other worker processes can reuse them instead of compiling the template again.
+    """
+
+    def __init__(self, maxsize=128, module_directory=None):
+        super().__init__(maxsize=maxsize)
+        self.module_directory = module_directory
+
+    def _compile_template(self, template_string, key):
+        """compile the template content, the generated module is shared using the module directory (if defined)
+
+        :param template_string:
+        :param key: hash of the template content
+        :return: mako.template.Template instance
+        """
+        if not self.module_directory:
+            return Template(template_string)
+
+        source_file = os.path.join(self.module_directory, key + ".mako")
+        try:
+            if not os.path.exists(source_file):
+                # write to a temporary file and move it afterwards, concurrent writers will always create the same
+                # content because the file name is derived from the template content
+                os.makedirs(self.module_directory, exist_ok=True)
+                fd, tmp_file = tempfile.mkstemp(dir=self.module_directory, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(template_string)
+                os.replace(tmp_file, source_file)
+
+        except OSError:
+            logger.error("unable to write template to module directory %s, "
+                         "compile in memory" % self.module_directory, exc_info=True)
+            return Template(template_string)
+
+        # Mako writes the generated module atomically to <module_directory>/<hash>.mako.py and reuses an existing one
+        return Template(
+            filename=source_file,
+            module_directory=self.module_directory,
+            uri=key + ".mako",
+            input_encoding="utf-8"
+        )
+
+    def get_template(self, template_string):
+        """get the compiled Mako template for the given template content, the template is only compiled on a cache
+        miss
+
+        :param template_string:
+        :return: mako.template.Template instance
+        """
+        key = get_template_hash(template_string)
+        template = self.get(key)
+        if template is None:
+            template = self._compile_template(template_string, key)
+            self.put(key, template)
+
+        return template
+
+    def remove_unused(self, template_hashes):
+        """remove the generated modules of all templates that are not used anymore from the module directory (e.g. of
+        changed or deleted Config Templates), the modules are shared between the processes and are therefore not
+        removed if a template is dropped from the cache
+
+        :param template_hashes: hashes of the templates that are kept
+        :return: number of removed templates
+        """
+        if not self.module_directory or not os.path.isdir(self.module_directory):
+            return 0
+
+        existing = set(template_hashes)
+        removed = set()
+        for file_name in os.listdir(self.module_directory):
+            # <hash>.mako, <hash>.mako.py and temporary files of incomplete writes
+            key, _, extension = file_name.partition(".")
+            if key in existing or extension not in ("mako", "mako.py", "tmp"):
+                continue
+
+            try:
+                os.remove(os.path.join(self.module_directory, file_name))
+
+            except FileNotFoundError:
+                pass
+
+            if extension != "tmp":
+                removed.add(key)
+
+        return len(removed)
+
+
+# compiled templates that are shared by all generators within the process
+template_cache = CompiledTemplateCache()
+
+
+class RenderedResultCache:
+    """
+    cache for rendered configurations, that is shared between the worker processes using a directory (disabled if no
+    directory is defined)
+
+    The key is a tuple of the template hash, the ID and the revision of the Template Value Set (see
+    TemplateValueSet.get_result_cache_key). Every result is stored in a file below a directory per Template Value Set,
+    older results of the same Template Value Set are removed when a new result is stored.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _get_path(self, key):
+        template_hash, template_value_set_id, revision = key
+        return os.path.join(self.directory, str(template_value_set_id), "%s_%s" % (template_hash, revision))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """get the cached result for the given key, returns None if the key is not cached
+
+        :param key:
+        :return:
+        """
+        result = None
+        if self.directory:
+            try:
+                with open(self._get_path(key), encoding="utf-8", newline="") as f:
+                    result = f.read()
+
+            except FileNotFoundError:
+                pass
+
+            except OSError:
+                logger.error("unable to read rendered result from %s" % self.directory, exc_info=True)
+
+        self._count(result is not None)
+        return result
+
+    def put(self, key, value):
+        """store a result, the previous results of the Template Value Set are removed
+
+        :param key:
+        :param value:
+        :return:
+        """
+        if not self.directory:
+            return
+
+        path = self._get_path(key)
+        result_directory = os.path.dirname(path)
+        try:
+            # write to a temporary file and move it afterwards, readers never see a partial result
+            os.makedirs(result_directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=result_directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(value)
+            os.replace(tmp_file, path)
+
+            for file_name in os.listdir(result_directory):
+                if file_name != os.path.basename(path) and not file_name.endswith(".tmp"):
+                    os.remove(os.path.join(result_directory, file_name))
+
+        except OSError:
+            logger.error("unable to write rendered result to %s" % self.directory, exc_info=True)
+
+    def remove_unused(self, template_value_set_ids):
+        """remove the results of all Template Value Sets that don't exist anymore
+
+        :param template_value_set_ids: IDs of the existing Template Value Sets
+        :return: number of removed directories
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+
+        existing = set(str(template_value_set_id) for template_value_set_id in template_value_set_ids)
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name not in existing:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                removed += 1
+
+        return removed
+
+    def clear(self):
+        """drop all results and reset the counters
+
+        :return:
+        """
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """get the statistics of the cache
+
+        :return: dictionary with the hits, misses and the directory of the cache
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "directory": self.directory
+            }
+
+
+# rendered configurations that are shared by all worker processes (see RenderedResultCache)
+rendered_result_cache = RenderedResultCache()
+
+
+# result of a single item within a batch rendering, either the result or the error is set
+RenderResult = namedtuple("RenderResult", ["result", "error"])
+
+# number of items that are rendered within a single call of a worker process
+RENDER_CHUNK_SIZE = 50
+
+
+def _render_chunk(template_string, remove_empty_lines, variable_dicts):
+    """render a chunk of a batch within a worker process (the compiled template is cached per worker process)
+
+    :param template_string:
+    :param remove_empty_lines:
+    :param variable_dicts: list of dictionaries with the variable values
+    :return: list of RenderResult tuples
+    """
+    dcg = MakoConfigGenerator(template_string=template_string)
+    return list(dcg.render_many(variable_dicts, remove_empty_lines=remove_empty_lines))
+
+
+def iter_output_chunks(rendered_result, remove_empty_lines=True):
+    """output pipeline of the rendered template, returns the result in chunks (one per line if the empty lines are
+    removed). The chunks are created in a single pass, joining them results in the post-processed configuration.
+
+    :param rendered_result: raw output of the Mako template
+    :param remove_empty_lines: true, if blank lines should be removed
+    :return: generator of strings
+    """
+    if not remove_empty_lines:
+        yield rendered_result
+        return
+
+    # a line break is added after every non-empty line, except if it is the last line of the result
+    separator = ""
+    followed_by_empty_line = False
+    for line in rendered_result.splitlines():
+        if line != "":
+            yield separator + line
+            separator = "\n"
+            followed_by_empty_line = False
+
+        elif separator:
+            followed_by_empty_line = True
+
+    if followed_by_empty_line:
+        yield "\n"
+
+
 class MakoConfigGenerator:
     """
     Config Generator that utilizes the Mako Template Engine
     """
 
+    # the state is stored per instance, a generator is therefore never shared between threads by accident
+    __slots__ = ("_template_string", "_template_variable_dict", "_template")
+
     # variable name regular expression
     _variable_name_regex = r"(\$\{[ ]*(?P<name>[a-zA-Z0-9_]+)[ ]*\})"
 
-    # template content
-    _template_string = None
-    _template_variable_dict = dict()
-
     @property
     def template_string(self):
         return self._template_string
@@ -36,6 +383,8 @@ class MakoConfigGenerator:
     @template_string.setter
     def template_string(self, value):
         self._template_string = value
+        # the compiled template is fetched from the template cache on the next rendering
+        self._template = None
         # clean list and parse data again
         self._parse_variable_from_template_string()
 
@@ -47,10 +396,9 @@ class MakoConfigGenerator:
         if type(template_string) is not str:
             raise ValueError("template string must be a string type")
 
+        self._template_variable_dict = dict()
         self.template_string = template_string
 
-        self._parse_variable_from_template_string()
-
     def _parse_variable_from_template_string(self):
         """populates the template_variables list with the variables that are found in the config template
 
@@ -86,45 +434,174 @@ class MakoConfigGenerator:
         """
         return self._template_variable_dict[variable]
 
-    def get_rendered_result(self, remove_empty_lines=True):
-        """render template result
+    @staticmethod
+    def _create_template_syntax_exception(ex):
+        """create a TemplateSyntaxException for the given exception that was raised by Mako (must be called within
+        the except block)
 
-        :param remove_empty_lines: true, if blank lines should be removed
+        :param ex:
         :return:
         """
-        try:
-            result = Template(self.template_string).render(**self._template_variable_dict)
-
-        except SyntaxException as ex:
+        if isinstance(ex, SyntaxException):
             msg = "Template Syntax error: %s" % str(ex)
-            logger.error(msg, exc_info=True)
-            raise TemplateSyntaxException(msg)
 
-        except CompileException as ex:
+        elif isinstance(ex, CompileException):
             msg = "Template Compile error: %s" % str(ex)
-            logger.error(msg, exc_info=True)
-            raise TemplateSyntaxException(msg)
 
-        except AttributeError as ex:
+        else:
             msg = "Template Attribute error: %s" % str(ex)
-            logger.error(msg, exc_info=True)
-            raise TemplateSyntaxException(msg)
+
+        logger.error(msg, exc_info=True)
+        return TemplateSyntaxException(msg)
+
+    def _get_template(self):
+        """get the compiled template of the template string
+
+        :return: mako.template.Template instance
+        """
+        if self._template is None:
+            try:
+                self._template = template_cache.get_template(self.template_string)
+
+            except Exception as ex:
+                raise self._create_template_syntax_exception(ex)
+
+        return self._template
+
+    def _render_raw(self, template, variables):
+        """render the compiled template with the given variables (without any post-processing)
+
+        :param template: compiled template
+        :param variables: dictionary with the variable values
+        :return:
+        """
+        try:
+            return template.render(**variables)
 
         except Exception as ex:
-            msg = "Template Attribute error: %s" % str(ex)
-            logger.error(msg, exc_info=True)
-            raise TemplateSyntaxException(msg)
-
-        # remove empty lines
-        if remove_empty_lines:
-            lines = result.splitlines()
-            result = ""
-            counter = 1
-            for line in lines:
-                if line != "":
-                    result += line
-                    if len(lines) != counter:
-                         result += "\n"
-                counter += 1
+            raise self._create_template_syntax_exception(ex)
 
-        return result
+    def _render(self, template, variables, remove_empty_lines=True):
+        """render the compiled template with the given variables and join the output chunks
+
+        :param template: compiled template
+        :param variables: dictionary with the variable values
+        :param remove_empty_lines: true, if blank lines should be removed
+        :return:
+        """
+        return "".join(iter_output_chunks(self._render_raw(template, variables), remove_empty_lines))
+
+    def _render_item(self, template, remove_empty_lines, variables):
+        """render a single item of a batch, the error is returned within the result
+
+        :param template: compiled template
+        :param remove_empty_lines: true, if blank lines should be removed
+        :param variables: dictionary with the variable values
+        :return: RenderResult
+        """
+        try:
+            return RenderResult(self._render(template, variables, remove_empty_lines), None)
+
+        except TemplateSyntaxException as ex:
+            return RenderResult(None, ex)
+
+    def get_rendered_result(self, remove_empty_lines=True):
+        """render template result
+
+        :param remove_empty_lines: true, if blank lines should be removed
+        :return:
+        """
+        return self._render(self._get_template(), self._template_variable_dict, remove_empty_lines)
+
+    def iter_rendered_result(self, remove_empty_lines=True):
+        """render the template and return the result in chunks, e.g. to write it to a streaming HTTP response or a
+        file
+
+        :param remove_empty_lines: true, if blank lines should be removed
+        :return: generator of strings
+        """
+        result = self._render_raw(self._get_template(), self._template_variable_dict)
+        return iter_output_chunks(result, remove_empty_lines)
+
+    def _merge_variable_dicts(self, variable_dicts):
+        """merge the given dictionaries of variable values with the values of the generator
+
+        :param variable_dicts: iterable of dictionaries with the variable values
+        :return: generator of dictionaries
+        """
+        for variable_dict in variable_dicts:
+            variables = dict(self._template_variable_dict)
+            variables.update(variable_dict)
+            yield variables
+
+    def _render_many_in_processes(self, variable_dicts, remove_empty_lines, processes):
+        """render the given list of variable dictionaries in chunks using a pool of worker processes
+
+        :param variable_dicts: list of dictionaries with the variable values
+        :param remove_empty_lines: true, if blank lines should be removed
+        :param processes: number of worker processes
+        :return: generator of RenderResult tuples (same order as the input)
+        """
+        chunks = [
+            variable_dicts[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(variable_dicts), RENDER_CHUNK_SIZE)
+        ]
+        if not chunks:
+            return
+
+        render_function = partial(_render_chunk, self.template_string, remove_empty_lines)
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as executor:
+            # all chunks are submitted before the first result is returned, errors during the start of the worker
+            # processes are therefore raised before any result is yielded
+            results = executor.map(render_function, chunks)
+            for result in itertools.chain.from_iterable(results):
+                yield result
+
+    def render_many(self, variable_dicts, remove_empty_lines=True, processes=0, threads=0):
+        """render the template once for every given dictionary of variable values
+
+        The template is compiled only once. Variables that are not defined within a dictionary use the values of the
+        generator. A rendering error doesn't stop the batch, it is returned within the result of the item.
+
+        :param variable_dicts: iterable of dictionaries with the variable values
+        :param remove_empty_lines: true, if blank lines should be removed
+        :param processes: number of worker processes that are used to render the items (parallel rendering is
+                          disabled if the value is lower than 2)
+        :param threads: number of threads that are used to render the items, if no worker processes are used
+                        (disabled if the value is lower than 2)
+        :return: generator of RenderResult tuples (same order as the input)
+        """
+        if processes and processes > 1:
+            variable_dicts = list(self._merge_variable_dicts(variable_dicts))
+            started = False
+            try:
+                for result in self._render_many_in_processes(variable_dicts, remove_empty_lines, processes):
+                    started = True
+                    yield result
+                return
+
+            except (AssertionError, OSError):
+                if started:
+                    raise
+
+                # e.g. daemonic processes are not allowed to create child processes
+                logger.error("unable to start worker processes, render configurations sequentially", exc_info=True)
+
+        try:
+            template = self._get_template()
+
+        except TemplateSyntaxException as ex:
+            # the template is invalid, no item can be rendered
+            for _ in variable_dicts:
+                yield RenderResult(None, ex)
+            return
+
+        render_function = partial(self._render_item, template, remove_empty_lines)
+        if threads and threads > 1:
+            # the generator state is not modified during the rendering, the items are rendered by a thread pool
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for result in executor.map(render_function, self._merge_variable_dicts(variable_dicts)):
+                    yield result
+
+        else:
+            for variables in self._merge_variable_dicts(variable_dicts):
+                yield render_function(variables)
@@ -0,0 +1,248 @@
+"""
+bulk import of Template Value Sets from CSV data
+"""
+import csv
+import json
+import logging
+import uuid
+
+from sqlalchemy import bindparam
+from app import app, db
+from app.models import ConfigTemplate, TemplateValueSet, TemplateValue, reset_variable_name_indexes, \
+    dump_packed_values
+from app.utils.database import supports_upsert, upsert_statement
+from app.utils.export import get_csv_variable_list
+
+logger = logging.getLogger("confgen")
+
+
+def _import_batch(config_template, variable_list, template_value_set_ids, batch):
+    """write a batch of CSV lines to the database using bulk statements
+
+    :param config_template:
+    :param variable_list: names of all variables of the Config Template
+    :param template_value_set_ids: dictionary with the hostname as key and the ID of the Template Value Set as value
+                                   (updated with the new Template Value Sets)
+    :param batch: dictionary with the hostname as key and a dictionary of the variable values as value
+    :return:
+    """
+    revision = uuid.uuid4().hex
+
+    # create the new Template Value Sets
+    new_hostnames = [hostname for hostname in batch.keys() if hostname not in template_value_set_ids]
+    if new_hostnames:
+        db.session.execute(TemplateValueSet.__table__.insert(), [
+            {
+                "hostname": hostname,
+                "revision": revision,
+                "packed_values": dump_packed_values(dict()) if app.config["PACKED_TEMPLATE_VALUES"] else None,
+                "config_template_id": config_template.id
+            } for hostname in new_hostnames
+        ])
+        template_value_set_ids.update(db.session.query(TemplateValueSet.hostname, TemplateValueSet.id).filter(
+            TemplateValueSet.config_template_id == config_template.id,
+            TemplateValueSet.hostname.in_(new_hostnames)
+        ))
+
+    # load the existing values of the Template Value Sets within the batch
+    batch_ids = dict((template_value_set_ids[hostname], hostname) for hostname in batch.keys())
+    packed_values = dict(db.session.query(TemplateValueSet.id, TemplateValueSet.packed_values).filter(
+        TemplateValueSet.id.in_(batch_ids.keys()),
+        TemplateValueSet.packed_values.isnot(None)
+    ))
+    # the database resolves existing values within the upsert statements
+    upsert = supports_upsert(db.session)
+    existing_values = dict()
+    if not upsert:
+        for row in db.session.query(
+            TemplateValue.id,
+            TemplateValue.template_value_set_id,
+            TemplateValue.var_name_slug,
+            TemplateValue.value
+        ).filter(TemplateValue.template_value_set_id.in_(batch_ids.keys())):
+            existing_values[(row.template_value_set_id, row.var_name_slug)] = row
+
+    new_rows = []
+    upsert_rows = []
+    changed_rows = []
+    changed_packed_rows = []
+    for template_value_set_id, hostname in batch_ids.items():
+        values = batch[hostname]
+        if template_value_set_id in packed_values:
+            existing_packed_values = json.loads(packed_values[template_value_set_id])
+            new_packed_values = dict(existing_packed_values)
+            for var_name in variable_list:
+                if var_name == "hostname":
+                    new_packed_values[var_name] = hostname
+
+                elif var_name in values:
+                    new_packed_values[var_name] = values[var_name]
+
+                else:
+                    new_packed_values.setdefault(var_name, "")
+
+            if new_packed_values != existing_packed_values:
+                changed_packed_rows.append({
+                    "value_set_id": template_value_set_id,
+                    "new_packed_values": dump_packed_values(new_packed_values)
+                })
+            continue
+
+        for var_name in variable_list:
+            if var_name == "hostname":
+                value = hostname
+
+            elif var_name in values:
+                value = values[var_name]
+
+            else:
+                # variables that are not part of the CSV data are kept (empty for new Template Value Sets)
+                value = ""
+
+            if upsert:
+                # values of the CSV data replace existing values, other values are only added if missing
+                (upsert_rows if var_name in values else new_rows).append({
+                    "var_name_slug": var_name,
+                    "value": value,
+                    "template_value_set_id": template_value_set_id
+                })
+                continue
+
+            existing_value = existing_values.get((template_value_set_id, var_name))
+            if existing_value is None:
+                new_rows.append({
+                    "var_name_slug": var_name,
+                    "value": value,
+                    "template_value_set_id": template_value_set_id
+                })
+
+            elif var_name in values and existing_value.value != value:
+                changed_rows.append({
+                    "value_id": existing_value.id,
+                    "new_value": value
+                })
+
+    index_elements = ["template_value_set_id", "var_name_slug"]
+    if new_rows:
+        if upsert:
+            db.session.execute(upsert_statement(TemplateValue.__table__, index_elements), new_rows)
+
+        else:
+            db.session.execute(TemplateValue.__table__.insert(), new_rows)
+
+    if upsert_rows:
+        db.session.execute(upsert_statement(TemplateValue.__table__, index_elements, ["value"]), upsert_rows)
+
+    if changed_rows:
+        table = TemplateValue.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam("value_id")).values(value=bindparam("new_value")),
+            changed_rows
+        )
+
+    table = TemplateValueSet.__table__
+    if changed_packed_rows:
+        db.session.execute(
+            table.update().where(table.c.id == bindparam("value_set_id")).values(
+                packed_values=bindparam("new_packed_values")
+            ),
+            changed_packed_rows
+        )
+
+    # the bulk statements are not tracked by the session
+    db.session.execute(table.update().where(table.c.id.in_(batch_ids.keys())).values(revision=revision))
+
+
+def import_template_value_sets_from_csv(config_template, csv_file, batch_size=500, progress_callback=None):
+    """import the Template Value Sets of a Config Template from CSV data (separated by semicolon, the first line
+    contains the variable names). Template Value Sets are identified by the hostname, missing Template Value Sets are
+    created. Columns that are not defined within the Config Template are ignored.
+
+    The CSV data is read line by line and written in batches using bulk statements within a single transaction, the
+    existing Template Value Sets are loaded once.
+
+    :param config_template:
+    :param csv_file: file object that is opened in text mode (or any iterable of lines)
+    :param batch_size: number of CSV lines that are written with a single batch
+    :param progress_callback: callable that is called with the number of processed lines after every batch
+    :return: dictionary with the `created` and `updated` hostnames and a list of `messages` (tuples of the message
+             and the category)
+    """
+    if type(config_template) is not ConfigTemplate:
+        raise ValueError
+
+    if batch_size < 1:
+        raise ValueError("batch size must be greater than 0")
+
+    result = {
+        "created": [],
+        "updated": [],
+        "messages": []
+    }
+
+    variable_list = get_csv_variable_list(config_template)
+    template_value_set_ids = dict(db.session.query(TemplateValueSet.hostname, TemplateValueSet.id).filter(
+        TemplateValueSet.config_template_id == config_template.id
+    ))
+
+    reader = csv.DictReader(csv_file, delimiter=";")
+    known_hostnames = set()
+    batch = dict()
+    processed_lines = 0
+
+    try:
+        for line in reader:
+            processed_lines += 1
+            if "hostname" not in line.keys():
+                # hostname not defined, no creation possible
+                result["messages"].append(("No hostname in CSV line found: %s" % line, "warning"))
+                continue
+
+            csv_line = ";".join(value for value in line.values() if type(value) is str)
+            if line["hostname"] is None:
+                result["messages"].append(("Invalid Hostname for Template Value Set: '%s'" % csv_line, "error"))
+
+            elif line["hostname"] == "":
+                result["messages"].append(("No Hostname defined for Template Value Set: '%s'" % csv_line, "error"))
+
+            else:
+                hostname = line["hostname"]
+                if hostname not in known_hostnames:
+                    known_hostnames.add(hostname)
+                    if hostname in template_value_set_ids:
+                        result["updated"].append(hostname)
+
+                    else:
+                        result["created"].append(hostname)
+                        result["messages"].append((
+                            "Create new Template Value Set for hostname <strong>%s</strong>" % hostname,
+                            "success"
+                        ))
+
+                values = batch.setdefault(hostname, dict())
+                for var_name in variable_list:
+                    if var_name in line.keys():
+                        values[var_name] = line[var_name] if line[var_name] else ""
+
+                if len(batch) >= batch_size:
+                    _import_batch(config_template, variable_list, template_value_set_ids, batch)
+                    batch = dict()
+                    if progress_callback:
+                        progress_callback(processed_lines)
+
+        if batch:
+            _import_batch(config_template, variable_list, template_value_set_ids, batch)
+
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    finally:
+        reset_variable_name_indexes(db.session)
+
+    if progress_callback:
+        progress_callback(processed_lines)
+
+    return result
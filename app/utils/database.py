@@ -0,0 +1,97 @@
+"""
+database engine configuration
+"""
+from flask.ext.sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event, or_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool
+
+# SQLSTATE of a unique violation on PostgreSQL
+PG_UNIQUE_VIOLATION = "23505"
+
+
+def is_unique_violation(ex):
+    """check if an IntegrityError is caused by a unique constraint (PostgreSQL and SQLite)
+
+    :param ex: IntegrityError from SQLAlchemy
+    :return:
+    """
+    orig = getattr(ex, "orig", ex)
+    if getattr(orig, "pgcode", None) == PG_UNIQUE_VIOLATION:
+        return True
+
+    return "UNIQUE constraint failed" in str(orig)
+
+
+def supports_upsert(session):
+    """check if the database of the session (or connection) supports `INSERT ... ON CONFLICT` statements
+
+    :param session:
+    :return:
+    """
+    dialect = getattr(session, "dialect", None) or session.get_bind().dialect
+    return dialect.name == "postgresql"
+
+
+def upsert_statement(table, index_elements, update_columns=None):
+    """create an `INSERT ... ON CONFLICT` statement for PostgreSQL, existing rows are updated with the given columns
+    (only if a value is changed) or kept if no update columns are given
+
+    :param table:
+    :param index_elements: columns of the unique constraint that identifies an existing row
+    :param update_columns: columns that are updated on existing rows
+    :return:
+    """
+    statement = postgresql.insert(table)
+    if not update_columns:
+        return statement.on_conflict_do_nothing(index_elements=index_elements)
+
+    return statement.on_conflict_do_update(
+        index_elements=index_elements,
+        set_=dict((name, statement.excluded[name]) for name in update_columns),
+        where=or_(*[table.c[name].is_distinct_from(statement.excluded[name]) for name in update_columns])
+    )
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """apply the given pragmas to a SQLite connection
+
+    :param dbapi_connection: sqlite3 connection
+    :param pragmas: dictionary with the name of the pragma as key and the value as value
+    :return:
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s=%s" % (name, value))
+
+    finally:
+        cursor.close()
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """
+    Flask-SQLAlchemy extension that keeps a pool of connections to file based SQLite databases (if the
+    `SQLALCHEMY_POOL_SIZE` is set) and applies the `SQLITE_PRAGMAS` to every new SQLite connection
+    """
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        if info.drivername == "sqlite" and "poolclass" not in options and options.get("pool_size"):
+            # SQLAlchemy uses a NullPool for file based SQLite databases by default
+            options["poolclass"] = QueuePool
+
+        if info.drivername == "sqlite" and options.get("poolclass") is QueuePool:
+            # the pooled connections are used by multiple threads (only one at a time)
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+
+    def get_engine(self, app, bind=None):
+        engine = super().get_engine(app, bind)
+        pragmas = app.config.get("SQLITE_PRAGMAS")
+        if engine.dialect.name == "sqlite" and pragmas and not getattr(engine, "sqlite_pragmas", None):
+            engine.sqlite_pragmas = dict(pragmas)
+
+            @event.listens_for(engine, "connect")
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                apply_sqlite_pragmas(dbapi_connection, engine.sqlite_pragmas)
+
+        return engine
@@ -1,14 +1,50 @@
 """
 export utility functions
 """
+import csv
+import hashlib
+import io
+import json
 import logging
 import os
+import tempfile
+import time
+import zipfile
 
-from app.models import TemplateValueSet
-from app import app
+from app.models import TemplateValueSet, ConfigTemplate, TemplateVariable
+from app import app, db
 
 logger = logging.getLogger("confgen")
 
+# name of the file within an export directory that describes the exported configuration files
+EXPORT_MANIFEST_FILE = ".export_manifest.json"
+
+
+class ZipStreamBuffer:
+    """
+    write-only file object that collects the data that is written by a ZipFile, used to stream a ZIP archive without
+    keeping the entire archive in memory
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """get all data that was written since the last call and clear the buffer
+
+        :return: bytes
+        """
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
 
 def get_appliance_ftp_password():
     """
@@ -26,7 +62,20 @@ def get_appliance_ftp_password():
         return "(not defined)"
 
 
-def export_configuration_to_file_system(template_value_set, root_folder):
+def get_export_directory(config_template, root_folder):
+    """
+    get the export directory of a config template within the root directory
+
+        `/<project_name>/<config_template_name>`
+
+    :param config_template:
+    :param root_folder:
+    :return:
+    """
+    return os.path.join(root_folder, config_template.project.name_slug, config_template.name_slug)
+
+
+def export_configuration_to_file_system(template_value_set, root_folder, config_result=None):
     """
     export a configuration from a template value set to the root directory with the following
     structure
@@ -35,16 +84,18 @@ def export_configuration_to_file_system(template_value_set, root_folder):
 
     :param template_value_set:
     :param root_folder:
+    :param config_result: already rendered configuration (optional, rendered if not set)
     :return:
     """
     if type(template_value_set) is not TemplateValueSet:
         raise ValueError
 
-    project_dir = template_value_set.config_template.project.name_slug
-    template_directory = template_value_set.config_template.name_slug
+    if config_result is None:
+        config_result = template_value_set.get_configuration_result()
+
     file_name = template_value_set.hostname + "_config.txt"
 
-    dest_dir = os.path.join(root_folder, project_dir, template_directory)
+    dest_dir = get_export_directory(template_value_set.config_template, root_folder)
     logger.info("export configuration file to: %s/%s" % (dest_dir, file_name))
 
     # check that the destination directory exists
@@ -52,10 +103,151 @@ def export_configuration_to_file_system(template_value_set, root_folder):
         os.makedirs(dest_dir, exist_ok=True)
 
     f = open(os.path.join(dest_dir, file_name), "w+")
-    f.write(template_value_set.get_configuration_result())
+    f.write(config_result)
     f.close()
 
 
+def _read_export_manifest(dest_dir):
+    """
+    read the manifest of an export directory, that contains the hash, size and modification time of all exported
+    configuration files
+
+    :param dest_dir:
+    :return: dictionary with the file name as key
+    """
+    try:
+        with open(os.path.join(dest_dir, EXPORT_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        if type(manifest) is dict:
+            return manifest
+
+    except FileNotFoundError:
+        pass
+
+    except (OSError, ValueError):
+        logger.warning("invalid export manifest in %s, compare the file content instead" % dest_dir, exc_info=True)
+
+    return dict()
+
+
+def _write_export_manifest(dest_dir, manifest):
+    """
+    write the manifest of an export directory (replaced atomically)
+
+    :param dest_dir:
+    :param manifest:
+    :return:
+    """
+    fd, tmp_file = tempfile.mkstemp(dir=dest_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, os.path.join(dest_dir, EXPORT_MANIFEST_FILE))
+
+
+def _is_file_unchanged(file_path, manifest_entry, config_result, content_hash):
+    """
+    check if the file already contains the given configuration. The manifest entry is only trusted if the size and
+    modification time of the file are unchanged, otherwise the file content is compared.
+
+    :param file_path:
+    :param manifest_entry: entry of the file within the export manifest (or None)
+    :param config_result:
+    :param content_hash:
+    :return:
+    """
+    try:
+        stat = os.stat(file_path)
+
+    except FileNotFoundError:
+        return False
+
+    if manifest_entry and manifest_entry.get("size") == stat.st_size and manifest_entry.get("mtime") == stat.st_mtime:
+        return manifest_entry.get("sha1") == content_hash
+
+    with open(file_path) as f:
+        return f.read() == config_result
+
+
+def export_config_template_to_file_system(config_template, root_folder, incremental=True):
+    """
+    export the configurations of all template value sets of a config template to the root directory (see
+    `export_configuration_to_file_system`). The template is compiled only once and a rendering error of a single
+    template value set doesn't stop the export.
+
+    Within the incremental mode, only changed configuration files are written. A manifest file in the export directory
+    keeps track of the exported files, configuration files of deleted template value sets are removed.
+
+    :param config_template:
+    :param root_folder:
+    :param incremental: write only the changed configuration files
+    :return: dictionary with the number of `written`, `skipped` and `removed` files and the `errors` (dictionary with
+             the hostname as key and the error message as value for all failed template value sets)
+    """
+    if type(config_template) is not ConfigTemplate:
+        raise ValueError
+
+    result = {
+        "written": 0,
+        "skipped": 0,
+        "removed": 0,
+        "errors": dict()
+    }
+
+    dest_dir = get_export_directory(config_template, root_folder)
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir, exist_ok=True)
+
+    old_manifest = _read_export_manifest(dest_dir) if incremental else dict()
+    manifest = dict()
+
+    config_results = config_template.get_configuration_results(
+        processes=app.config["RENDER_PROCESSES"],
+        threads=app.config["RENDER_THREADS"],
+        yield_per=app.config["TEMPLATE_VALUES_YIELD_PER"]
+    )
+    for template_value_set, render_result in config_results:
+        file_name = template_value_set.hostname + "_config.txt"
+        file_path = os.path.join(dest_dir, file_name)
+
+        if render_result.error:
+            result["errors"][template_value_set.hostname] = str(render_result.error)
+            # keep the last exported configuration of the template value set
+            if file_name in old_manifest:
+                manifest[file_name] = old_manifest[file_name]
+            continue
+
+        content_hash = hashlib.sha1(render_result.result.encode("utf-8")).hexdigest()
+
+        if incremental and _is_file_unchanged(file_path, old_manifest.get(file_name), render_result.result,
+                                              content_hash):
+            result["skipped"] += 1
+
+        else:
+            export_configuration_to_file_system(template_value_set, root_folder, render_result.result)
+            result["written"] += 1
+
+        stat = os.stat(file_path)
+        manifest[file_name] = {
+            "sha1": content_hash,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime
+        }
+
+    # remove the files of template value sets that are not longer part of the config template (files that were not
+    # created by the export are never removed)
+    for file_name in set(old_manifest.keys()) - set(manifest.keys()):
+        file_path = os.path.join(dest_dir, file_name)
+        if os.path.basename(file_name) == file_name and os.path.exists(file_path):
+            logger.info("remove configuration file: %s" % file_path)
+            os.remove(file_path)
+            result["removed"] += 1
+
+    _write_export_manifest(dest_dir, manifest)
+
+    return result
+
+
 def export_configuration_to_local_ftp(template_value_set):
     """
     export configuration to the local FTP directory using the following pattern:
@@ -88,3 +280,123 @@ def export_configuration_to_local_tftp(template_value_set):
         raise ValueError
 
     export_configuration_to_file_system(template_value_set, app.config["TFTP_DIRECTORY"])
+
+
+def export_config_template_to_local_ftp(config_template):
+    """
+    export all configurations of a config template to the local FTP directory (see
+    `export_configuration_to_local_ftp` and `export_config_template_to_file_system`)
+
+    :param config_template:
+    :return: dictionary with the number of `written`, `skipped` and `removed` files and the `errors`
+    """
+    return export_config_template_to_file_system(
+        config_template,
+        app.config["FTP_DIRECTORY"],
+        incremental=app.config["INCREMENTAL_EXPORT"]
+    )
+
+
+def export_config_template_to_local_tftp(config_template):
+    """
+    export all configurations of a config template to the local TFTP directory (see
+    `export_configuration_to_local_tftp` and `export_config_template_to_file_system`)
+
+    :param config_template:
+    :return: dictionary with the number of `written`, `skipped` and `removed` files and the `errors`
+    """
+    return export_config_template_to_file_system(
+        config_template,
+        app.config["TFTP_DIRECTORY"],
+        incremental=app.config["INCREMENTAL_EXPORT"]
+    )
+
+
+def get_csv_variable_list(config_template):
+    """get the names of the variables that are used as CSV columns for the Config Template (hostname as first entry)
+
+    :param config_template:
+    :return:
+    """
+    variable_list = ["hostname"]
+    for row in db.session.query(TemplateVariable.var_name_slug).filter(
+        TemplateVariable.config_template_id == config_template.id
+    ).order_by(TemplateVariable.id):
+        if row.var_name_slug != "hostname":
+            variable_list.append(row.var_name_slug)
+
+    return variable_list
+
+
+def iter_config_template_values_csv(config_template):
+    """generate the CSV data (separated by semicolon) with the values of all Template Value Sets of a Config Template.
+    The first line contains the variable names, every other line the values of a Template Value Set. All values are
+    loaded using a single query and the CSV data is returned line by line.
+
+    :param config_template:
+    :return: generator of strings
+    """
+    if type(config_template) is not ConfigTemplate:
+        raise ValueError
+
+    variable_list = get_csv_variable_list(config_template)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", lineterminator="\n")
+
+    def pop_line():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(variable_list)
+    yield pop_line()
+
+    value_dicts = config_template.iter_template_value_dicts(yield_per=app.config["TEMPLATE_VALUES_YIELD_PER"])
+    for _, hostname, values in value_dicts:
+        values["hostname"] = hostname
+        writer.writerow(["" if values.get(var_name) is None else values[var_name] for var_name in variable_list])
+        yield pop_line()
+
+
+def iter_config_template_zip_archive(config_template):
+    """
+    generate a ZIP archive with the configurations of all template value sets of a config template. The
+    configurations are rendered and compressed one after another and the archive is returned in chunks, therefore
+    the archive is never kept entirely in memory.
+
+    If the rendering of a template value set fails, a `<hostname>_error.txt` file with the error message is added
+    instead of the configuration.
+
+    :param config_template:
+    :return: generator of bytes
+    """
+    if type(config_template) is not ConfigTemplate:
+        raise ValueError
+
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        config_results = config_template.get_configuration_results(
+            processes=app.config["RENDER_PROCESSES"],
+            threads=app.config["RENDER_THREADS"],
+            yield_per=app.config["TEMPLATE_VALUES_YIELD_PER"]
+        )
+        for template_value_set, render_result in config_results:
+            if render_result.error:
+                # add the error message instead of the configuration
+                data = zipfile.ZipInfo(template_value_set.hostname + "_error.txt")
+                content = str(render_result.error)
+
+            else:
+                data = zipfile.ZipInfo(template_value_set.hostname + "_config.txt")
+                content = render_result.result
+
+            data.date_time = time.localtime(time.time())[:6]
+            data.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(data, content)
+
+            yield buffer.pop()
+
+    # central directory of the archive
+    yield buffer.pop()
@@ -0,0 +1,143 @@
+"""
+extension of the Alembic autogenerate for the database migrations (`manage.py db migrate`)
+
+SQLite cannot alter a foreign key, the table is recreated in batch mode instead. The foreign keys of databases that
+were created by older releases have no name, Alembic cannot drop them within a batch operation. Changed foreign keys
+without a name are therefore rendered as a separate batch operation, that names the reflected foreign keys using the
+`FOREIGN_KEY_NAMING_CONVENTION`.
+"""
+from alembic.autogenerate import comparators, renderers
+from alembic.operations import ops
+
+# naming convention that is used to identify (and name) the recreated foreign keys on SQLite
+FOREIGN_KEY_NAMING_CONVENTION = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"
+}
+
+
+def get_foreign_key_name(table_name, local_columns, referent_table):
+    """get the name of a foreign key according to the `FOREIGN_KEY_NAMING_CONVENTION`
+
+    :param table_name:
+    :param local_columns:
+    :param referent_table:
+    :return:
+    """
+    return FOREIGN_KEY_NAMING_CONVENTION["fk"] % {
+        "table_name": table_name,
+        "column_0_name": local_columns[0],
+        "referred_table_name": referent_table
+    }
+
+
+class RecreateForeignKeysOp(ops.MigrateOperation):
+    """
+    recreate the foreign keys of a table in batch mode, every foreign key is described by a dictionary with the
+    `local_columns`, `referent_table`, `remote_columns` and the options (`ondelete` and `onupdate`)
+    """
+    def __init__(self, table_name, old_foreign_keys, new_foreign_keys, schema=None):
+        self.table_name = table_name
+        self.old_foreign_keys = old_foreign_keys
+        self.new_foreign_keys = new_foreign_keys
+        self.schema = schema
+
+    def reverse(self):
+        return RecreateForeignKeysOp(self.table_name, self.new_foreign_keys, self.old_foreign_keys, self.schema)
+
+    def to_diff_tuple(self):
+        return "recreate_foreign_keys", self.table_name, self.old_foreign_keys, self.new_foreign_keys
+
+
+def _foreign_key_from_constraint(constraint):
+    # the referred table of a reflected constraint is not necessarily part of the metadata
+    targets = [element.target_fullname.split(".") for element in constraint.elements]
+    return {
+        "local_columns": list(constraint.column_keys),
+        "referent_table": targets[0][-2],
+        "remote_columns": [target[-1] for target in targets],
+        "ondelete": constraint.ondelete,
+        "onupdate": constraint.onupdate
+    }
+
+
+def _foreign_key_from_create_op(create_op):
+    return {
+        "local_columns": list(create_op.local_cols),
+        "referent_table": create_op.referent_table,
+        "remote_columns": list(create_op.remote_cols),
+        "ondelete": create_op.kw.get("ondelete"),
+        "onupdate": create_op.kw.get("onupdate")
+    }
+
+
+@comparators.dispatch_for("schema")
+def recreate_unnamed_foreign_keys(autogen_context, upgrade_ops, schemas):
+    """replace the changes of unnamed foreign keys on SQLite with a `RecreateForeignKeysOp` (runs after the comparison
+    of the tables)
+
+    :param autogen_context:
+    :param upgrade_ops:
+    :param schemas:
+    :return:
+    """
+    if autogen_context.dialect.name != "sqlite":
+        return
+
+    for modify_table_ops in [op for op in upgrade_ops.ops if isinstance(op, ops.ModifyTableOps)]:
+        dropped_foreign_keys = [
+            op for op in modify_table_ops.ops
+            if isinstance(op, ops.DropConstraintOp) and op.constraint_type == "foreignkey" and not op.constraint_name
+        ]
+        created_foreign_keys = [op for op in modify_table_ops.ops if isinstance(op, ops.CreateForeignKeyOp)]
+        if not dropped_foreign_keys:
+            continue
+
+        for op in dropped_foreign_keys + created_foreign_keys:
+            modify_table_ops.ops.remove(op)
+
+        if not modify_table_ops.ops:
+            upgrade_ops.ops.remove(modify_table_ops)
+
+        upgrade_ops.ops.append(RecreateForeignKeysOp(
+            modify_table_ops.table_name,
+            [_foreign_key_from_constraint(op.to_constraint()) for op in dropped_foreign_keys],
+            [_foreign_key_from_create_op(op) for op in created_foreign_keys],
+            schema=modify_table_ops.schema
+        ))
+
+
+@renderers.dispatch_for(RecreateForeignKeysOp)
+def render_recreate_foreign_keys(autogen_context, op):
+    """render the batch operation, the reflected foreign keys are named using the naming convention
+
+    :param autogen_context:
+    :param op:
+    :return: lines of the migration script
+    """
+    lines = [
+        "with %sbatch_alter_table(%r, schema=%r, naming_convention=%r) as batch_op:" % (
+            autogen_context.opts.get("alembic_module_prefix", "op."),
+            op.table_name,
+            op.schema,
+            FOREIGN_KEY_NAMING_CONVENTION
+        )
+    ]
+    for foreign_key in op.old_foreign_keys:
+        lines.append("batch_op.drop_constraint(%r, type_='foreignkey')" % get_foreign_key_name(
+            op.table_name, foreign_key["local_columns"], foreign_key["referent_table"]
+        ))
+
+    for foreign_key in op.new_foreign_keys:
+        options = "".join(
+            ", %s=%r" % (name, foreign_key[name]) for name in ("ondelete", "onupdate") if foreign_key[name]
+        )
+        lines.append("batch_op.create_foreign_key(%r, %r, %r, %r%s)" % (
+            get_foreign_key_name(op.table_name, foreign_key["local_columns"], foreign_key["referent_table"]),
+            foreign_key["referent_table"],
+            foreign_key["local_columns"],
+            foreign_key["remote_columns"],
+            options
+        ))
+
+    lines.append("")
+    return lines
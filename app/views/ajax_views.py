@@ -1,9 +1,13 @@
+import os
+import tempfile
 from flask import request, jsonify, url_for
 
 from app import app
+from app.models import ConfigTemplate
 from config import ROOT_URL
 from app.tasks import debug_celery_task
 from app.tasks import update_local_ftp_configurations, update_local_tftp_configurations
+from app.tasks import import_template_value_sets_from_csv_file
 
 
 @app.route(ROOT_URL + "debug/calculate_task", methods=['POST'])
@@ -42,3 +46,78 @@ def update_local_tftp_config_task(config_template_id):
     task = update_local_tftp_configurations.delay(config_template_id)
 
     return jsonify({}), 202, {'Location': url_for('task_status_json', task_id=task.id)}
+
+
+@app.route(ROOT_URL + "import/template/<int:config_template_id>/csv", methods=['POST'])
+def import_template_value_sets_csv_task(config_template_id):
+    """
+    used to trigger the import of the Template Value Sets from an uploaded CSV file (`csv_file`) in the background
+    :param config_template_id:
+    :return:
+    """
+    ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+
+    csv_file = request.files.get("csv_file")
+    if not csv_file or not csv_file.filename:
+        return jsonify({"error": "no CSV file uploaded"}), 400
+
+    # the upload is copied in chunks to a file within the configured directory that is shared with the celery worker
+    os.makedirs(app.config["CSV_IMPORT_DIRECTORY"], exist_ok=True)
+    fd, csv_file_path = tempfile.mkstemp(suffix=".csv", dir=app.config["CSV_IMPORT_DIRECTORY"])
+    with os.fdopen(fd, "wb") as f:
+        csv_file.save(f)
+
+    task = import_template_value_sets_from_csv_file.delay(config_template_id, csv_file_path)
+
+    return jsonify({}), 202, {'Location': url_for('task_status_json', task_id=task.id)}
+
+
+@app.route(ROOT_URL + "template/<int:config_template_id>/value_sets", methods=['GET'])
+def template_value_sets_json(config_template_id):
+    """
+    returns a page of the Template Value Sets of the given config template ordered by hostname including their values
+    (used for the infinite scrolling), the page is selected using the `after` and `prefix` arguments
+    :param config_template_id:
+    :return:
+    """
+    config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+
+    hostname_prefix = request.args.get("prefix", "").strip()
+    template_value_sets, next_hostname = config_template.get_template_value_set_page(
+        after_hostname=request.args.get("after"),
+        hostname_prefix=hostname_prefix,
+        per_page=app.config["TEMPLATE_VALUE_SETS_PER_PAGE"]
+    )
+
+    result = {
+        "template_value_sets": [],
+        "next_hostname": next_hostname,
+        "next": None,
+        "next_page": None
+    }
+    for template_value_set_id, hostname, values in template_value_sets:
+        url_args = dict(config_template_id=config_template.id, template_value_set_id=template_value_set_id)
+        result["template_value_sets"].append({
+            "id": template_value_set_id,
+            "hostname": hostname,
+            "values": values,
+            "urls": {
+                "view": url_for("view_template_value_set", **url_args),
+                "view_config": url_for("view_config", **url_args),
+                "download_config": url_for("download_config", **url_args),
+                "edit": url_for("edit_template_value_set", **url_args),
+                "delete": url_for("delete_template_value_set", **url_args)
+            }
+        })
+
+    if next_hostname is not None:
+        page_args = dict(after=next_hostname, prefix=hostname_prefix or None)
+        result["next"] = url_for("template_value_sets_json", config_template_id=config_template.id, **page_args)
+        result["next_page"] = url_for(
+            "view_config_template",
+            project_id=config_template.project_id,
+            config_template_id=config_template.id,
+            **page_args
+        )
+
+    return jsonify(result)
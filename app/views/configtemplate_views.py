@@ -1,16 +1,18 @@
 """
 views for the Config Template data object
 """
-import csv
+import codecs
 import logging
 import io
-from flask import render_template, url_for, redirect, request, flash, jsonify
+from flask import render_template, url_for, redirect, request, flash, jsonify, Response, stream_with_context
 from sqlalchemy.exc import IntegrityError
 from app import app, db
-from app.models import ConfigTemplate, Project, TemplateValueSet
+from app.models import ConfigTemplate, Project
 from app.forms import ConfigTemplateForm, EditConfigTemplateValuesForm
 from app.utils.appliance import get_local_ip_addresses, verify_appliance_status
-from app.utils.export import get_appliance_ftp_password
+from app.utils.csv_import import import_template_value_sets_from_csv
+from app.utils.database import is_unique_violation
+from app.utils.export import get_appliance_ftp_password, iter_config_template_values_csv
 from app.tasks import update_local_ftp_configurations, update_local_tftp_configurations
 from config import ROOT_URL
 
@@ -26,10 +28,26 @@ def view_config_template(project_id, config_template_id):
     :return:
     """
     parent_project = Project.query.filter(Project.id == project_id).first_or_404()
+    config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+
+    # the Template Value Sets are shown in pages ordered by hostname
+    hostname_prefix = request.args.get("prefix", "").strip()
+    after_hostname = request.args.get("after")
+    template_value_sets, next_hostname = config_template.get_template_value_set_page(
+        after_hostname=after_hostname,
+        hostname_prefix=hostname_prefix,
+        per_page=app.config["TEMPLATE_VALUE_SETS_PER_PAGE"]
+    )
+
     return render_template(
         "config_template/view_config_template.html",
         project=parent_project,
-        config_template=ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+        config_template=config_template,
+        variables=config_template.variables.all(),
+        template_value_sets=template_value_sets,
+        hostname_prefix=hostname_prefix,
+        after_hostname=after_hostname,
+        next_hostname=next_hostname
     )
 
 
@@ -66,7 +84,7 @@ def add_config_template(project_id):
             )
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Config Template name already in use, please use another one"
 
             else:
@@ -104,11 +122,16 @@ def edit_config_template(project_id, config_template_id):
 
     if form.validate_on_submit():
         try:
+            keep_values = app.config["RECONCILE_TEMPLATE_VALUES"]
             if form.template_content.data != config_template.template_content:
-                flash("Config Template content changed, all Template Value Sets are deleted.", "warning")
+                if keep_values:
+                    flash("Config Template content changed, the values of removed variables are deleted.", "warning")
+
+                else:
+                    flash("Config Template content changed, all Template Value Sets are deleted.", "warning")
 
             config_template.name = form.name.data
-            config_template.template_content = form.template_content.data
+            config_template.update_template_content(form.template_content.data, keep_values=keep_values)
             config_template.project = parent_project
 
             db.session.add(config_template)
@@ -125,7 +148,7 @@ def edit_config_template(project_id, config_template_id):
             )
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Config Template name already in use, please use another one"
 
             else:
@@ -165,63 +188,33 @@ def edit_all_config_template_values(project_id, config_template_id):
 
     form = EditConfigTemplateValuesForm(request.form, config_template)
 
-    # hostname is defined in every Template Value Set
-    variable_list = [
-        "hostname"
-    ]
-    for var in config_template.variables.all():
-        # hostname must be located as first entry
-        if var.var_name != "hostname":
-            variable_list.append(var.var_name)
-
     if form.validate_on_submit():
-        # update values from the CSV file
-        reader = csv.DictReader(io.StringIO(form.csv_content.data), delimiter=";")
-        csv_lines = form.csv_content.data.splitlines()
-        counter = 0
-        for line in reader:
-            if "hostname" in line.keys():
-                if line["hostname"] is None:
-                    flash("Invalid Hostname for Template Value Set: '%s'" % csv_lines[counter], "error")
-
-                elif line["hostname"] == "":
-                    flash("No Hostname defined for Template Value Set: '%s'" % form.csv_content.data.splitlines()[counter], "error")
+        # update values from the uploaded CSV file (read from the spooled upload) or the textarea
+        csv_file = request.files.get(form.csv_file.name)
+        if csv_file and csv_file.filename:
+            csv_data = codecs.iterdecode(csv_file.stream, "utf-8")
 
-                else:
-                    # try to access an existing TemplateValueSet
-                    tvs = TemplateValueSet.query.filter(
-                        TemplateValueSet.config_template_id == config_template_id,
-                        TemplateValueSet.hostname == line["hostname"]
-                    ).first()
-                    if not tvs:
-                        # element not found, create and add a flush message
-                        tvs = TemplateValueSet(hostname=line["hostname"], config_template=config_template)
-                        flash("Create new Template Value Set for hostname <strong>%s</strong>" % line["hostname"], "success")
-
-                    # update variable values
-                    for var in variable_list:
-                        if var in line.keys():
-                            if line[var]:
-                                tvs.update_variable_value(var_name=var, value=line[var])
-
-                            else:
-                                tvs.update_variable_value(var_name=var, value="")
-                                logger.debug("Cannot find value for variable %s for TVS "
-                                             "object %s using CSV line %s" % (var, repr(tvs), line))
-            else:
-                # hostname not defined, no creation possible
-                flash("No hostname in CSV line found: %s" % line, "warning")
-            counter += 1
+        else:
+            csv_data = io.StringIO(form.csv_content.data, newline="")
+
+        try:
+            import_result = import_template_value_sets_from_csv(
+                config_template,
+                csv_data,
+                batch_size=app.config["CSV_IMPORT_BATCH_SIZE"]
+            )
+            for message, category in import_result["messages"]:
+                flash(message, category)
+
+        except Exception:
+            msg = "Template Value Sets were not imported (unknown error, see log for details)"
+            logger.error(msg, exc_info=True)
+            flash(msg, "error")
 
         return redirect(url_for("view_config_template", project_id=project_id, config_template_id=config_template_id))
 
     else:
-        form.csv_content.data = ";".join(variable_list)
-        for tvs in config_template.template_value_sets.all():
-            values = []
-            for var in variable_list:
-                values.append(tvs.get_template_value_by_name_as_string(var))
-            form.csv_content.data += "\n" + ";".join(values)
+        form.csv_content.data = "".join(iter_config_template_values_csv(config_template)).rstrip("\n")
 
     return render_template(
         "config_template/edit_all_config_template_values.html",
@@ -231,6 +224,26 @@ def edit_all_config_template_values(project_id, config_template_id):
     )
 
 
+@app.route(ROOT_URL + "project/<int:project_id>/configtemplate/<int:config_template_id>/download_values")
+def download_config_template_values_as_csv(project_id, config_template_id):
+    """download the values of all Template Value Sets of the Config Template as CSV file
+
+    :param project_id:
+    :param config_template_id:
+    :return:
+    """
+    Project.query.filter(Project.id == project_id).first_or_404()
+    config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
+
+    # stream the CSV data
+    response = Response(
+        stream_with_context(iter_config_template_values_csv(config_template)),
+        mimetype="text/csv"
+    )
+    response.headers.add("Content-Disposition", "attachment", filename=config_template.name + "_values.csv")
+    return response
+
+
 @app.route(ROOT_URL + "project/<int:project_id>/configtemplate/<int:config_template_id>/delete", methods=["GET", "POST"])
 def delete_config_template(project_id, config_template_id):
     """delete the Config Template
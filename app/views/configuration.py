@@ -2,14 +2,11 @@
 views for the resulting configuration
 """
 import logging
-import zipfile
-from io import BytesIO
-import time
-from flask import render_template, make_response, send_file
+from flask import render_template, make_response, Response, stream_with_context
 from app import app
 from app.models import ConfigTemplate, TemplateValueSet, Project
 from app.utils.appliance import get_local_ip_addresses
-from app.utils.export import get_appliance_ftp_password
+from app.utils.export import get_appliance_ftp_password, iter_config_template_zip_archive
 from config import ROOT_URL
 
 logger = logging.getLogger()
@@ -70,14 +67,10 @@ def download_all_config_as_zip(project_id, config_template_id):
     Project.query.filter(Project.id == project_id).first_or_404()
     config_template = ConfigTemplate.query.filter(ConfigTemplate.id == config_template_id).first_or_404()
 
-    # generate ZIP archive with all configurations
-    memory_file = BytesIO()
-    with zipfile.ZipFile(memory_file, 'w') as zf:
-        for values in config_template.template_value_sets.all():
-            data = zipfile.ZipInfo(values.hostname + "_config.txt")
-            data.date_time = time.localtime(time.time())[:6]
-            data.compress_type = zipfile.ZIP_DEFLATED
-            zf.writestr(data, values.get_configuration_result())
-    memory_file.seek(0)
-
-    return send_file(memory_file, attachment_filename=config_template.name + "_configs.zip", as_attachment=True)
\ No newline at end of file
+    # stream the ZIP archive with all configurations
+    response = Response(
+        stream_with_context(iter_config_template_zip_archive(config_template)),
+        mimetype="application/zip"
+    )
+    response.headers.add("Content-Disposition", "attachment", filename=config_template.name + "_configs.zip")
+    return response
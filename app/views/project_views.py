@@ -8,6 +8,7 @@ from app import app, db
 from app.forms import ProjectForm
 from config import ROOT_URL
 from app.models import Project
+from app.utils.database import is_unique_violation
 
 logger = logging.getLogger()
 
@@ -55,7 +56,7 @@ def add_project():
             return redirect(url_for("view_project", project_id=project.id))
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Project name already in use, please use another one"
 
             else:
@@ -96,7 +97,7 @@ def edit_project(project_id):
             return redirect(url_for("view_project", project_id=project.id))
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Project name already in use, please use another one"
 
             else:
@@ -7,6 +7,7 @@ from sqlalchemy.exc import IntegrityError
 from app import app, db
 from app.models import TemplateValueSet, ConfigTemplate
 from app.forms import TemplateValueSetForm
+from app.utils.database import is_unique_violation
 from config import ROOT_URL
 
 logger = logging.getLogger()
@@ -58,7 +59,7 @@ def add_template_value_set(config_template_id):
             ))
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Template Value Set hostname already in use, please use another one"
 
             else:
@@ -104,11 +105,13 @@ def edit_template_value_set(config_template_id, template_value_set_id):
             template_value_set.copy_variables_from_config_template()
 
             # update variable data
+            values = dict()
             for key in template_value_set.get_template_value_names():
-                template_value_set.update_variable_value(var_name=key, value=request.form["edit_" + key])
+                values[key] = request.form["edit_" + key]
 
             # hostname is always the same as the name of the template value set
-            template_value_set.update_variable_value(var_name="hostname", value=template_value_set.hostname)
+            values["hostname"] = template_value_set.hostname
+            template_value_set.update_variable_values(values)
 
             db.session.add(template_value_set)
             db.session.commit()
@@ -121,7 +124,7 @@ def edit_template_value_set(config_template_id, template_value_set_id):
             ))
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Template Value Set hostname already in use, please use another one"
 
             else:
@@ -7,6 +7,7 @@ from sqlalchemy.exc import IntegrityError
 from app import app, db
 from app.models import ConfigTemplate, TemplateVariable
 from app.forms import TemplateVariableForm
+from app.utils.database import is_unique_violation
 from config import ROOT_URL
 
 logger = logging.getLogger()
@@ -54,7 +55,7 @@ def edit_template_variable(config_template_id, template_variable_id):
             )
 
         except IntegrityError as ex:
-            if "UNIQUE constraint failed" in str(ex):
+            if is_unique_violation(ex):
                 msg = "Template variable name already in use, please use another one"
 
             else:
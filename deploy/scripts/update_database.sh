@@ -9,3 +9,4 @@ if [ ! -d '/var/www/network_config_generator/migrations' ]; then
 fi
 sudo -u ncg -E venv/bin/python3 manage.py db migrate
 sudo -u ncg -E venv/bin/python3 manage.py db upgrade
+sudo -u ncg -E venv/bin/python3 manage.py clean_cache
@@ -3,14 +3,41 @@ import os
 from flask.ext.script import Manager, Server
 from flask.ext.migrate import Migrate, MigrateCommand
 from app import app, db
+from app.models import ConfigTemplate, TemplateValueSet
+from app.utils.confgen import get_template_hash, rendered_result_cache, template_cache
+# registers the autogenerate extension for the foreign keys on SQLite
+from app.utils import migrations  # noqa
 
 app.config.from_object(os.getenv('APP_SETTINGS', "config.DefaultConfig"))
 
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, render_as_batch=True)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.option("--packed", dest="packed", action="store_true", help="use the packed storage (default: row storage)")
+def convert_value_storage(packed=False):
+    """convert the values of all Template Value Sets to the packed or the row storage"""
+    for config_template in ConfigTemplate.query.all():
+        count = config_template.set_packed_storage(packed)
+        print("%s: %d Template Value Sets converted" % (config_template.name, count))
+
+
+@manager.command
+def clean_cache():
+    """remove the rendered configurations of deleted Template Value Sets and the compiled modules of changed or deleted
+    Config Templates from the shared caches"""
+    template_value_set_ids = [row.id for row in db.session.query(TemplateValueSet.id)]
+    count = rendered_result_cache.remove_unused(template_value_set_ids)
+    print("%d rendered configurations removed" % count)
+
+    template_contents = db.session.query(ConfigTemplate._template_content.label("content"))
+    template_hashes = [get_template_hash(row.content or "") for row in template_contents]
+    count = template_cache.remove_unused(template_hashes)
+    print("%d compiled templates removed" % count)
+
+
 manager.add_command('runserver', Server(
     use_debugger=os.getenv('DEBUG_MODE', True),
     use_reloader=os.getenv('FLASK_RELOADER', True),
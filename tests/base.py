@@ -3,9 +3,12 @@ base classes for Flask test cases using the Flask-Testing module
 """
 import os
 import sys
+from contextlib import contextmanager
 from flask.ext.testing import TestCase, LiveServerTestCase
 from selenium.webdriver.firefox import webdriver
+from sqlalchemy import event
 from app import app, db
+from app.context_processors import invalidate_project_data_cache
 from config import APP_BASE_DIR
 
 
@@ -21,6 +24,28 @@ class BaseFlaskTest(TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        # pooled SQLite connections keep the schema of the dropped tables
+        db.engine.dispose()
+        # the tables are dropped without the session
+        invalidate_project_data_cache()
+
+    @contextmanager
+    def record_statements(self):
+        """
+        record the SQL statements that are executed within the context
+        :return: list of the executed statements
+        """
+        statements = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
 
 
 class BaseFlaskLiveServerTest(LiveServerTestCase):
@@ -5,3 +5,5 @@ from .views_test import *
 from .models_test import *
 from .confgen_test import *
 from .export_test import *
+from .csv_import_test import *
+from .database_test import *
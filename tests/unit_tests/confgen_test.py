@@ -1,9 +1,14 @@
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
 from mako.exceptions import CompileException
 
 from app.utils import MakoConfigGenerator
-from app.utils.confgen import TemplateSyntaxException
+from app.utils.confgen import TemplateSyntaxException, CompiledTemplateCache, template_cache, get_template_hash, \
+    iter_output_chunks, RenderedResultCache
 
 
 class MakoConfigGeneratorTest(unittest.TestCase):
@@ -208,3 +213,278 @@ var_2 is always present: ${ var_2 }"""
         dcg.set_variable_value("var_2", "value2")
         with self.assertRaises(TemplateSyntaxException):
             dcg.get_rendered_result()
+
+    def test_compiled_template_cache(self):
+        test_template = "hostname ${ hostname }"
+        template_cache.clear()
+
+        dcg = MakoConfigGenerator(template_string=test_template)
+        dcg.set_variable_value("hostname", "first")
+        self.assertEqual(dcg.get_rendered_result(), "hostname first")
+
+        # the same template content is only compiled once
+        other_dcg = MakoConfigGenerator(template_string=test_template)
+        other_dcg.set_variable_value("hostname", "second")
+        self.assertEqual(other_dcg.get_rendered_result(), "hostname second")
+
+        info = template_cache.info()
+        self.assertEqual(info["misses"], 1)
+        self.assertEqual(info["hits"], 1)
+        self.assertEqual(info["size"], 1)
+
+    def test_compiled_template_cache_size_limit(self):
+        cache = CompiledTemplateCache(maxsize=2)
+
+        first = cache.get_template("first ${ var }")
+        cache.get_template("second ${ var }")
+        self.assertIs(cache.get_template("first ${ var }"), first)
+
+        # the least recently used template is dropped
+        cache.get_template("third ${ var }")
+        self.assertEqual(cache.info()["size"], 2)
+        self.assertIsNone(cache.get(get_template_hash("second ${ var }")))
+        self.assertIs(cache.get(get_template_hash("first ${ var }")), first)
+
+    def test_compiled_template_cache_with_module_directory(self):
+        test_template = "hostname ${ hostname } ${ 'äöü' }"
+        module_directory = tempfile.mkdtemp()
+        try:
+            cache = CompiledTemplateCache(module_directory=module_directory)
+            template = cache.get_template(test_template)
+            self.assertEqual(template.render(hostname="first"), "hostname first äöü")
+
+            module_file = os.path.join(module_directory, get_template_hash(test_template) + ".mako.py")
+            self.assertTrue(os.path.isfile(module_file))
+            module_mtime = os.stat(module_file).st_mtime
+
+            # another process reuses the generated module without compiling the template again
+            other_cache = CompiledTemplateCache(module_directory=module_directory)
+            template = other_cache.get_template(test_template)
+            self.assertEqual(template.render(hostname="second"), "hostname second äöü")
+            self.assertEqual(os.stat(module_file).st_mtime, module_mtime)
+
+            # the files of templates that are not used anymore are removed
+            other_template = "hostname ${ hostname }"
+            cache.get_template(other_template)
+            with open(os.path.join(module_directory, "incomplete.tmp"), "w") as f:
+                f.write(other_template)
+            self.assertEqual(cache.remove_unused([get_template_hash(test_template)]), 1)
+            self.assertEqual(sorted(os.listdir(module_directory)), [
+                get_template_hash(test_template) + ".mako",
+                get_template_hash(test_template) + ".mako.py"
+            ])
+            self.assertEqual(cache.remove_unused([get_template_hash(test_template)]), 0)
+
+        finally:
+            shutil.rmtree(module_directory)
+
+    def test_rendered_result_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = RenderedResultCache(directory=directory)
+            self.assertIsNone(cache.get(("hash", 1, "first")))
+            cache.put(("hash", 1, "first"), "hostname first\r\näöü\n")
+            cache.put(("hash", 2, "first"), "hostname second")
+
+            # the results are shared with other processes
+            other_cache = RenderedResultCache(directory=directory)
+            self.assertEqual(other_cache.get(("hash", 1, "first")), "hostname first\r\näöü\n")
+            self.assertEqual(other_cache.info()["hits"], 1)
+            self.assertEqual(cache.info()["misses"], 1)
+
+            # a new revision replaces the previous result
+            cache.put(("hash", 1, "second"), "hostname changed")
+            self.assertIsNone(cache.get(("hash", 1, "first")))
+            self.assertEqual(cache.get(("hash", 1, "second")), "hostname changed")
+            self.assertEqual(os.listdir(os.path.join(directory, "1")), ["hash_second"])
+
+            # the results of deleted Template Value Sets are removed
+            self.assertEqual(cache.remove_unused([2]), 1)
+            self.assertEqual(os.listdir(directory), ["2"])
+
+            # disabled without directory
+            cache = RenderedResultCache()
+            cache.put(("hash", 1, "first"), "hostname first")
+            self.assertIsNone(cache.get(("hash", 1, "first")))
+
+        finally:
+            shutil.rmtree(directory)
+
+    def test_compiled_template_cache_with_module_directory_syntax_error(self):
+        module_directory = tempfile.mkdtemp()
+        try:
+            dcg = MakoConfigGenerator(template_string="% if var:\ninvalid\n% endfor")
+            template_cache.module_directory = module_directory
+            with self.assertRaises(TemplateSyntaxException):
+                dcg.get_rendered_result()
+
+        finally:
+            template_cache.module_directory = None
+            shutil.rmtree(module_directory)
+
+    def test_render_many(self):
+        test_template = "hostname ${ hostname }\n!\n${ var_1 }"
+        variable_dicts = [
+            {"hostname": "first", "var_1": "value1"},
+            {"hostname": "second"},
+        ]
+        expected_results = [
+            "hostname first\n!\nvalue1",
+            "hostname second\n!\ndefault",
+        ]
+
+        dcg = MakoConfigGenerator(template_string=test_template)
+        dcg.set_variable_value("var_1", "default")
+
+        results = list(dcg.render_many(variable_dicts))
+        self.assertEqual([r.result for r in results], expected_results)
+        self.assertEqual([r.error for r in results], [None, None])
+
+    def test_render_many_with_errors(self):
+        test_template = "hostname ${ hostname }\n${ 10 / int(var_1) }"
+        variable_dicts = [
+            {"hostname": "first", "var_1": "5"},
+            {"hostname": "second", "var_1": "0"},
+            {"hostname": "third", "var_1": "2"},
+        ]
+
+        dcg = MakoConfigGenerator(template_string=test_template)
+        results = list(dcg.render_many(variable_dicts))
+
+        # a failed item doesn't stop the batch
+        self.assertEqual(results[0].result, "hostname first\n2.0")
+        self.assertIsNone(results[1].result)
+        self.assertIsInstance(results[1].error, TemplateSyntaxException)
+        self.assertEqual(results[2].result, "hostname third\n5.0")
+
+        # if the template is invalid, every item contains the error
+        dcg.template_string = "% if var_1:\ninvalid\n% endfor"
+        results = list(dcg.render_many(variable_dicts))
+        self.assertEqual(len(results), 3)
+        for r in results:
+            self.assertIsNone(r.result)
+            self.assertIsInstance(r.error, TemplateSyntaxException)
+
+    def test_render_many_in_worker_processes(self):
+        test_template = "hostname ${ hostname }\n${ 10 / int(var_1) }"
+        variable_dicts = [{"hostname": "host%d" % i, "var_1": str(i % 5)} for i in range(120)]
+
+        dcg = MakoConfigGenerator(template_string=test_template)
+        expected_results = list(dcg.render_many(variable_dicts))
+        results = list(dcg.render_many(variable_dicts, processes=2))
+
+        # the order and the results are the same as within the sequential rendering
+        self.assertEqual(len(results), 120)
+        self.assertEqual([r.result for r in results], [r.result for r in expected_results])
+        self.assertEqual(results[1].result, "hostname host1\n10.0")
+        for i in range(0, 120, 5):
+            self.assertIsInstance(results[i].error, TemplateSyntaxException)
+
+    def test_remove_empty_lines_of_large_result(self):
+        test_template = """% for i in range(int(count)):
+interface GigabitEthernet0/${ i }
+
+ description ${ hostname }
+% endfor
+"""
+        dcg = MakoConfigGenerator(template_string=test_template)
+        dcg.set_variable_value("count", "10000")
+        dcg.set_variable_value("hostname", "core")
+
+        expected_result = "\n".join(
+            "interface GigabitEthernet0/%d\n description core" % i for i in range(10000)
+        )
+        self.assertEqual(dcg.get_rendered_result(), expected_result)
+        self.assertEqual("".join(dcg.iter_rendered_result()), expected_result)
+
+        # the raw result is returned as a single chunk, if empty lines are not removed
+        chunks = list(dcg.iter_rendered_result(remove_empty_lines=False))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].count("\n"), 30000)
+
+    def test_remove_empty_lines(self):
+        self.assertEqual(list(iter_output_chunks("\nfirst\n\n\nsecond\n\n")), ["first", "\nsecond", "\n"])
+        self.assertEqual(list(iter_output_chunks("")), [])
+        self.assertEqual(list(iter_output_chunks("\n\n")), [])
+
+    def test_remove_empty_lines_keeps_the_previous_output(self):
+        def remove_empty_lines(result):
+            # previous implementation of MakoConfigGenerator.get_rendered_result
+            lines = result.splitlines()
+            result = ""
+            counter = 1
+            for line in lines:
+                if line != "":
+                    result += line
+                    if len(lines) != counter:
+                        result += "\n"
+                counter += 1
+            return result
+
+        test_strings = [
+            "a\n\nb\n\n",
+            "a\nb\n",
+            "a\nb",
+            "\n\na\n",
+            "a\n\n\n",
+            "\n",
+            "a",
+            "interface Gi0/1\n description test\n\n!\n\n\n",
+        ]
+        for test_string in test_strings:
+            self.assertEqual(remove_empty_lines(test_string), "".join(iter_output_chunks(test_string)),
+                             repr(test_string))
+
+        # a template with a trailing loop
+        dcg = MakoConfigGenerator(
+            template_string="hostname ${ hostname }\n% for i in range(2):\nline ${ i }\n\n% endfor\n"
+        )
+        dcg.set_variable_value("hostname", "router")
+        self.assertEqual(dcg.get_rendered_result(), "hostname router\nline 0\nline 1\n")
+
+    def test_generator_state_is_not_shared(self):
+        first = MakoConfigGenerator(template_string="${ first_var }")
+        second = MakoConfigGenerator(template_string="${ second_var }")
+        first.set_variable_value("additional", "value")
+
+        self.assertEqual(first.template_variables, ["additional", "first_var"])
+        self.assertEqual(second.template_variables, ["second_var"])
+        with self.assertRaises(AttributeError):
+            first.unknown_attribute = "value"
+
+    def test_render_in_multiple_threads(self):
+        test_template = "hostname ${ hostname }\n% for i in range(int(count)):\nline ${ i } of ${ hostname }\n% endfor"
+        errors = []
+
+        def render(thread_id):
+            for i in range(25):
+                hostname = "host-%d-%d" % (thread_id, i)
+                dcg = MakoConfigGenerator(template_string=test_template)
+                dcg.set_variable_value("hostname", hostname)
+                dcg.set_variable_value("count", str(thread_id % 5 + 1))
+
+                expected_result = "hostname %s\n" % hostname + "\n".join(
+                    "line %d of %s" % (n, hostname) for n in range(thread_id % 5 + 1)
+                )
+                if dcg.get_rendered_result() != expected_result:
+                    errors.append(hostname)
+
+        threads = [threading.Thread(target=render, args=(thread_id,)) for thread_id in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_render_many_in_threads(self):
+        test_template = "hostname ${ hostname }\n${ 10 / int(var_1) }"
+        variable_dicts = [{"hostname": "host%d" % i, "var_1": str(i % 5)} for i in range(200)]
+
+        dcg = MakoConfigGenerator(template_string=test_template)
+        expected_results = [r.result for r in dcg.render_many(variable_dicts)]
+        results = list(dcg.render_many(variable_dicts, threads=8))
+
+        self.assertEqual([r.result for r in results], expected_results)
+        for i in range(0, 200, 5):
+            self.assertIsInstance(results[i].error, TemplateSyntaxException)
@@ -0,0 +1,107 @@
+"""
+Test cases for the CSV import of Template Value Sets
+"""
+import io
+from app import app, db
+from app.models import Project, ConfigTemplate, TemplateValueSet
+from app.utils.csv_import import import_template_value_sets_from_csv
+from tests import BaseFlaskTest
+
+
+class CsvImportTest(BaseFlaskTest):
+    """
+    test the CSV import of Template Value Sets
+    """
+
+    def _create_test_data(self):
+        p = Project(name="project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${ hostname } ${ var_1 } ${ var_2 }")
+        tvs = TemplateValueSet(hostname="host_0", config_template=ct)
+        tvs.update_variable_values({"var_1": "old value 1", "var_2": "old value 2"})
+        db.session.add_all([p, ct, tvs])
+        db.session.commit()
+        return ct
+
+    def test_import_template_value_sets_from_csv(self):
+        ct = self._create_test_data()
+        csv_data = io.StringIO(
+            "hostname;var_1;unknown_var\n"
+            "host_0;new value 1;unknown\n"
+            "host_1;value 1;unknown\n"
+            ";value;unknown\n"
+            "host_1;changed value 1;unknown\n"
+        )
+        progress = []
+
+        result = import_template_value_sets_from_csv(ct, csv_data, batch_size=1, progress_callback=progress.append)
+
+        self.assertEqual(result["created"], ["host_1"])
+        self.assertEqual(result["updated"], ["host_0"])
+        self.assertIn(("Create new Template Value Set for hostname <strong>host_1</strong>", "success"),
+                      result["messages"])
+        self.assertIn("No Hostname defined for Template Value Set", result["messages"][-1][0])
+        self.assertEqual(progress[-1], 4)
+        self.assertEqual(len(ct.template_value_sets.all()), 2)
+
+        tvs = TemplateValueSet.query.filter_by(hostname="host_0", config_template=ct).first()
+        self.assertEqual(tvs.get_template_value_dict(), {
+            "hostname": "host_0",
+            "var_1": "new value 1",
+            "var_2": "old value 2"
+        })
+
+        # the last line of a hostname wins
+        tvs = TemplateValueSet.query.filter_by(hostname="host_1", config_template=ct).first()
+        self.assertEqual(tvs.get_template_value_dict(), {
+            "hostname": "host_1",
+            "var_1": "changed value 1",
+            "var_2": ""
+        })
+        self.assertEqual(tvs.get_configuration_result(), "host_1 changed value 1 ")
+
+    def test_import_template_value_sets_from_csv_statement_count(self):
+        ct = self._create_test_data()
+        csv_data = io.StringIO("hostname;var_1;var_2\n" + "\n".join(
+            "host_%d;value %d;value %d" % (i, i, i) for i in range(1000)
+        ))
+
+        with self.record_statements() as statements:
+            result = import_template_value_sets_from_csv(ct, csv_data, batch_size=250)
+
+        # the number of statements depends only on the number of batches
+        self.assertLess(len(statements), 30, statements)
+        self.assertEqual(len(result["created"]), 999)
+        self.assertEqual(len(ct.template_value_sets.all()), 1000)
+        tvs = TemplateValueSet.query.filter_by(hostname="host_500", config_template=ct).first()
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_2"), "value 500")
+
+    def test_import_template_value_sets_with_packed_storage(self):
+        ct = self._create_test_data()
+        csv_data = io.StringIO(
+            "hostname;var_1\n"
+            "host_0;new value 1\n"
+            "host_1;value 1\n"
+        )
+
+        app.config["PACKED_TEMPLATE_VALUES"] = True
+        try:
+            result = import_template_value_sets_from_csv(ct, csv_data)
+
+        finally:
+            app.config["PACKED_TEMPLATE_VALUES"] = False
+
+        self.assertEqual(result["created"], ["host_1"])
+
+        # existing template value sets keep their storage
+        tvs = TemplateValueSet.query.filter_by(hostname="host_0", config_template=ct).first()
+        self.assertFalse(tvs.is_packed)
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_1"), "new value 1")
+
+        tvs = TemplateValueSet.query.filter_by(hostname="host_1", config_template=ct).first()
+        self.assertTrue(tvs.is_packed)
+        self.assertEqual(tvs.get_template_value_dict(), {"hostname": "host_1", "var_1": "value 1", "var_2": ""})
+
+        # update the packed template value set
+        import_template_value_sets_from_csv(ct, io.StringIO("hostname;var_2\nhost_1;value 2\n"))
+        tvs = TemplateValueSet.query.filter_by(hostname="host_1", config_template=ct).first()
+        self.assertEqual(tvs.get_template_value_dict(), {"hostname": "host_1", "var_1": "value 1", "var_2": "value 2"})
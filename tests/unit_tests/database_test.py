@@ -0,0 +1,201 @@
+"""
+test of the database engine configuration
+"""
+import textwrap
+import threading
+import time
+from unittest import skipUnless
+import sqlalchemy as sa
+from alembic.autogenerate import produce_migrations, render_python_code
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from tests import BaseFlaskTest
+from app import app, db
+from app.models import Project, TemplateValue
+from app.utils.database import is_unique_violation, upsert_statement
+from app.utils.migrations import RecreateForeignKeysOp
+from config import TestConfig
+
+
+@skipUnless(TestConfig.SQLALCHEMY_DATABASE_URI.startswith("sqlite"), "requires a SQLite database")
+class SQLiteEngineProfileTest(BaseFlaskTest):
+
+    def test_sqlite_pragmas_on_new_connections(self):
+        connection = db.engine.connect()
+        try:
+            self.assertEqual("wal", connection.execute("PRAGMA journal_mode").scalar())
+            self.assertEqual(
+                app.config["SQLITE_PRAGMAS"]["busy_timeout"],
+                connection.execute("PRAGMA busy_timeout").scalar()
+            )
+            # NORMAL
+            self.assertEqual(1, connection.execute("PRAGMA synchronous").scalar())
+            self.assertEqual(
+                app.config["SQLITE_PRAGMAS"]["cache_size"],
+                connection.execute("PRAGMA cache_size").scalar()
+            )
+            self.assertEqual(1, connection.execute("PRAGMA foreign_keys").scalar())
+
+        finally:
+            connection.close()
+
+    def test_reader_is_not_blocked_by_concurrent_commits(self):
+        db.session.add(Project(name="First Project"))
+        db.session.commit()
+
+        # open a read transaction on another connection
+        reader = db.engine.connect()
+        try:
+            reader.execute("BEGIN")
+            self.assertEqual(1, reader.execute("SELECT count(*) FROM project").scalar())
+
+            # the writer commits while the read transaction is open (without WAL, the commit waits for the busy timeout
+            # and fails with "database is locked")
+            start = time.perf_counter()
+            for i in range(10):
+                db.session.add(Project(name="Project %d" % i))
+                db.session.commit()
+            elapsed = time.perf_counter() - start
+
+            self.assertLess(elapsed, app.config["SQLITE_PRAGMAS"]["busy_timeout"] / 1000)
+
+            # the reader continues with a consistent snapshot
+            self.assertEqual(1, reader.execute("SELECT count(*) FROM project").scalar())
+            reader.execute("COMMIT")
+            self.assertEqual(11, reader.execute("SELECT count(*) FROM project").scalar())
+
+        finally:
+            reader.close()
+
+    def test_pooled_connections_are_used_by_other_threads(self):
+        # the connection is returned to the pool and used again by another thread
+        db.engine.execute("SELECT 1")
+        results = []
+        errors = []
+
+        def query():
+            try:
+                results.append(db.engine.execute("SELECT count(*) FROM project").scalar())
+
+            except Exception as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+
+        self.assertIs(db.engine.pool.__class__, sa.pool.QueuePool)
+        self.assertEqual([], errors)
+        self.assertEqual([0], results)
+
+
+class SQLiteMigrationTest(BaseFlaskTest):
+
+    def test_migrate_unnamed_foreign_keys(self):
+        # schema of a database that was created by an older release (unnamed foreign keys without ON DELETE CASCADE)
+        engine = create_engine("sqlite://")
+        connection = engine.connect()
+        connection.execute("CREATE TABLE project (id INTEGER NOT NULL, PRIMARY KEY (id))")
+        connection.execute("CREATE TABLE config_template (id INTEGER NOT NULL, project_id INTEGER NOT NULL, "
+                           "PRIMARY KEY (id), FOREIGN KEY(project_id) REFERENCES project (id))")
+        connection.execute("INSERT INTO project (id) VALUES (1)")
+        connection.execute("INSERT INTO config_template (id, project_id) VALUES (1, 1)")
+
+        metadata = sa.MetaData()
+        sa.Table("project", metadata, sa.Column("id", sa.Integer, primary_key=True))
+        sa.Table("config_template", metadata,
+                 sa.Column("id", sa.Integer, primary_key=True),
+                 sa.Column("project_id", sa.Integer, sa.ForeignKey("project.id", ondelete="CASCADE"), nullable=False))
+
+        migration_context = MigrationContext.configure(connection)
+        upgrade_ops = produce_migrations(migration_context, metadata).upgrade_ops
+        self.assertEqual([type(op) for op in upgrade_ops.ops], [RecreateForeignKeysOp])
+
+        # run the rendered migration script
+        script = render_python_code(upgrade_ops, render_as_batch=True)
+        self.assertIn("naming_convention=", script)
+        script = textwrap.dedent("\n".join(line for line in script.splitlines() if not line.startswith("#")))
+        exec(script, {"op": Operations(migration_context), "sa": sa})
+
+        foreign_keys = inspect(connection).get_foreign_keys("config_template")
+        self.assertEqual(len(foreign_keys), 1)
+        self.assertEqual(foreign_keys[0]["name"], "fk_config_template_project_id_project")
+        self.assertEqual(foreign_keys[0]["options"], {"ondelete": "CASCADE"})
+        self.assertEqual(connection.execute("SELECT count(*) FROM config_template").scalar(), 1)
+
+        # the schema is up to date
+        self.assertTrue(produce_migrations(migration_context, metadata).upgrade_ops.is_empty())
+        connection.close()
+
+
+class DatabaseBackendTest(BaseFlaskTest):
+
+    def test_unique_violation_detection(self):
+        db.session.add(Project(name="Project"))
+        db.session.commit()
+
+        db.session.add(Project(name="Project"))
+        with self.assertRaises(IntegrityError) as context:
+            db.session.commit()
+        db.session.rollback()
+
+        self.assertTrue(is_unique_violation(context.exception))
+
+        # not null constraint
+        db.session.add(Project(name=None))
+        with self.assertRaises(IntegrityError) as context:
+            db.session.commit()
+        db.session.rollback()
+
+        self.assertFalse(is_unique_violation(context.exception))
+
+    def test_unique_violation_detection_with_postgresql_error_code(self):
+        class PostgreSQLError(Exception):
+            pgcode = "23505"
+
+        ex = IntegrityError("INSERT INTO project (name) VALUES (%(name)s)", {"name": "Project"}, PostgreSQLError())
+        self.assertTrue(is_unique_violation(ex))
+
+        PostgreSQLError.pgcode = "23502"
+        self.assertFalse(is_unique_violation(ex))
+
+    def test_upsert_statement(self):
+        index_elements = ["template_value_set_id", "var_name_slug"]
+
+        statement = str(upsert_statement(TemplateValue.__table__, index_elements, ["value"]).compile(
+            dialect=postgresql.dialect()
+        ))
+        self.assertIn("ON CONFLICT (template_value_set_id, var_name_slug) DO UPDATE SET value = excluded.value",
+                      statement)
+        self.assertIn("WHERE template_value.value IS DISTINCT FROM excluded.value", statement)
+
+        statement = str(upsert_statement(TemplateValue.__table__, index_elements).compile(
+            dialect=postgresql.dialect()
+        ))
+        self.assertIn("ON CONFLICT (template_value_set_id, var_name_slug) DO NOTHING", statement)
+
+    def test_indexes(self):
+        inspector = inspect(db.engine)
+
+        def get_indexes(table_name):
+            return dict((index["name"], index["column_names"]) for index in inspector.get_indexes(table_name))
+
+        template_value_indexes = get_indexes("template_value")
+        self.assertEqual(
+            ["template_value_set_id", "var_name_slug"],
+            template_value_indexes["ix_template_value_template_value_set_id_var_name_slug"]
+        )
+        self.assertEqual(
+            ["config_template_id", "hostname"],
+            get_indexes("template_value_set")["ix_template_value_set_config_template_id_hostname"]
+        )
+
+        # large text columns are not indexed
+        for table_name, column_name in [("template_value", "value"),
+                                        ("template_variable", "description"),
+                                        ("config_template", "_template_content")]:
+            for columns in get_indexes(table_name).values():
+                self.assertNotIn(column_name, columns)
@@ -3,10 +3,12 @@ Test cases for the export features
 """
 import os
 import shutil
+import tempfile
 from app import db, app
 from app.models import Project, ConfigTemplate, TemplateValueSet
 from app.utils.export import get_appliance_ftp_password, export_configuration_to_local_ftp, \
-    export_configuration_to_local_ftp, export_configuration_to_file_system
+    export_configuration_to_local_ftp, export_configuration_to_file_system, export_config_template_to_local_ftp, \
+    export_config_template_to_file_system, iter_config_template_values_csv
 from tests import BaseFlaskTest
 
 
@@ -103,6 +105,107 @@ class LocalExportConfigurationTest(BaseFlaskTest):
         # cleanup
         shutil.rmtree(os.path.join(app.config["FTP_DIRECTORY"], "project"))
 
+    def test_export_config_template_to_local_ftp(self):
+        """
+        export all configurations of a config template to the local ftp server
+        :return:
+        """
+        self._create_test_data()
+        expected_directory = os.path.join(app.config["FTP_DIRECTORY"], "project", "template")
+
+        ct = ConfigTemplate.query.filter_by(name="template").first()
+        result = export_config_template_to_local_ftp(ct)
+
+        # verify result
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(result["written"], 4)
+        for hostname in ["tvs1", "tvs2", "tvs3", "tvs4"]:
+            f = open(os.path.join(expected_directory, hostname + "_config.txt"))
+            file_content = f.read()
+            f.close()
+            self.assertEqual("!\nhostname %s\n!" % hostname, file_content)
+
+        # cleanup
+        shutil.rmtree(os.path.join(app.config["FTP_DIRECTORY"], "project"))
+
+    def test_incremental_export_config_template_to_file_system(self):
+        """
+        export only the changed configurations of a config template
+        :return:
+        """
+        self._create_test_data()
+        root_folder = tempfile.mkdtemp()
+        expected_directory = os.path.join(root_folder, "project", "template")
+        ct = ConfigTemplate.query.filter_by(name="template").first()
+
+        try:
+            result = export_config_template_to_file_system(ct, root_folder)
+            self.assertEqual((result["written"], result["skipped"], result["removed"]), (4, 0, 0))
+
+            # nothing changed
+            result = export_config_template_to_file_system(ct, root_folder)
+            self.assertEqual((result["written"], result["skipped"], result["removed"]), (0, 4, 0))
+
+            # change a single value and delete a template value set
+            tvs1 = TemplateValueSet.query.filter_by(hostname="tvs1").first()
+            tvs1.update_variable_value("hostname", "changed")
+            db.session.delete(TemplateValueSet.query.filter_by(hostname="tvs4").first())
+            db.session.commit()
+
+            result = export_config_template_to_file_system(ct, root_folder)
+            self.assertEqual((result["written"], result["skipped"], result["removed"]), (1, 2, 1))
+            self.assertFalse(os.path.exists(os.path.join(expected_directory, "tvs4_config.txt")))
+            f = open(os.path.join(expected_directory, "tvs1_config.txt"))
+            self.assertEqual(f.read(), "!\nhostname changed\n!")
+            f.close()
+
+            # a file that was modified outside of the export is written again
+            f = open(os.path.join(expected_directory, "tvs2_config.txt"), "w")
+            f.write("modified")
+            f.close()
+            result = export_config_template_to_file_system(ct, root_folder)
+            self.assertEqual((result["written"], result["skipped"], result["removed"]), (1, 2, 0))
+
+            # all files are written within the non-incremental mode
+            result = export_config_template_to_file_system(ct, root_folder, incremental=False)
+            self.assertEqual((result["written"], result["skipped"], result["removed"]), (3, 0, 0))
+
+        finally:
+            shutil.rmtree(root_folder)
+
+    def test_export_config_template_to_local_ftp_with_invalid_value(self):
+        """
+        test ValueError is no ConfigTemplate is given
+        :return:
+        """
+        with self.assertRaises(ValueError):
+            export_config_template_to_local_ftp("Moh")
+
+    def test_config_template_values_csv(self):
+        """
+        generate the CSV data with the values of all template value sets using a single query
+        :return:
+        """
+        p = Project(name="project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${ hostname } ${ var_1 } ${ var_2 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+        for i in range(50):
+            tvs = TemplateValueSet(hostname="host_%d" % i, config_template=ct)
+            tvs.update_variable_values({"var_1": "value %d" % i, "var_2": "a;b" if i == 1 else ""})
+
+        with self.record_statements() as statements:
+            lines = list(iter_config_template_values_csv(ct))
+
+        self.assertLess(len(statements), 5, statements)
+        self.assertEqual(len(lines), 50+1)
+        self.assertEqual(lines[0], "hostname;var_1;var_2\n")
+        self.assertEqual(lines[1], "host_0;value 0;\n")
+        self.assertEqual(lines[2], 'host_1;value 1;"a;b"\n')
+
+        with self.assertRaises(ValueError):
+            list(iter_config_template_values_csv("Moh"))
+
     def test_permission_error_export_configuration_to_local_directory(self):
         """
         failed configuration export to a local directory
@@ -1,11 +1,16 @@
 """
 test of the model classes that are used within the application
 """
+import tempfile
+from unittest import mock
 from app.exception import TemplateVariableNotFoundException, TemplateValueNotFoundException
 from tests import BaseFlaskTest
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
-from app import db
+from sqlalchemy.orm import Session
+from app import app, db
 from app.models import Project, ConfigTemplate, TemplateVariable, TemplateValueSet, TemplateValue
+from app.utils.confgen import rendered_result_cache
 
 
 class ProjectDataModelTest(BaseFlaskTest):
@@ -186,6 +191,65 @@ class ProjectDataModelTest(BaseFlaskTest):
         self.assertTrue(len(Project.query.all()) == 0)
         self.assertTrue(len(ConfigTemplate.query.all()) == 0)
 
+    def _create_project_with_values(self, name, template_count=2, value_set_count=20):
+        p = Project(name=name)
+        db.session.add(p)
+        for i in range(template_count):
+            ct = ConfigTemplate(name="template %d" % i, project=p, template_content="${ var_1 } ${ var_2 }")
+            db.session.add(ct)
+            db.session.commit()
+            for j in range(value_set_count):
+                tvs = TemplateValueSet(hostname="tvs%d" % j, config_template=ct)
+                tvs.update_variable_values({"var_1": "value 1", "var_2": "value 2"})
+        return p
+
+    def test_project_delete_on_database_level(self):
+        p1 = self._create_project_with_values("Project 1")
+        p2 = self._create_project_with_values("Project 2")
+        p2_id = p2.id
+        self.assertEqual(TemplateValue.query.count(), 2 * 2 * 20 * 3)
+
+        # delete the project with a single statement, the foreign keys cascade the delete
+        db.session.execute(Project.__table__.delete().where(Project.__table__.c.id == p2_id))
+        db.session.commit()
+
+        self.assertEqual(Project.query.count(), 1)
+        self.assertEqual(ConfigTemplate.query.count(), 2)
+        self.assertEqual(TemplateVariable.query.count(), 2 * 3)
+        self.assertEqual(TemplateValueSet.query.count(), 2 * 20)
+        self.assertEqual(TemplateValue.query.count(), 2 * 20 * 3)
+        self.assertEqual(p1.configtemplates.count(), 2)
+
+    def test_project_delete_statement_count(self):
+        p1 = self._create_project_with_values("Project 1")
+        p2 = self._create_project_with_values("Project 2", value_set_count=40)
+        db.session.expire_all()
+
+        with self.record_statements() as statements:
+            db.session.delete(p2)
+            db.session.commit()
+
+        # the associated objects are not loaded
+        self.assertLess(len(statements), 10, statements)
+        self.assertEqual(Project.query.all(), [p1])
+        self.assertEqual(ConfigTemplate.query.count(), 2)
+        self.assertEqual(TemplateVariable.query.count(), 2 * 3)
+        self.assertEqual(TemplateValueSet.query.count(), 2 * 20)
+        self.assertEqual(TemplateValue.query.count(), 2 * 20 * 3)
+
+        # delete a single Config Template and Template Value Set
+        ct = p1.configtemplates.first()
+        db.session.delete(ct)
+        db.session.commit()
+        self.assertEqual(ConfigTemplate.query.count(), 1)
+        self.assertEqual(TemplateValueSet.query.count(), 20)
+        self.assertEqual(TemplateValue.query.count(), 20 * 3)
+
+        db.session.delete(TemplateValueSet.query.first())
+        db.session.commit()
+        self.assertEqual(TemplateValueSet.query.count(), 19)
+        self.assertEqual(TemplateValue.query.count(), 19 * 3)
+
 
 class ConfigTemplateDataModelTest(BaseFlaskTest):
 
@@ -305,6 +369,94 @@ class ConfigTemplateDataModelTest(BaseFlaskTest):
         with self.assertRaises(TemplateVariableNotFoundException):
             ct1.get_template_variable_by_name("unknown key")
 
+    def test_config_template_create_variables_from_content_statement_count(self):
+        p = Project("project")
+        db.session.add(p)
+        db.session.commit()
+        template_content = "\n".join("interface ${ interface_%d }" % i for i in range(200))
+
+        with self.record_statements() as statements:
+            ct = ConfigTemplate(name="template", project=p, template_content=template_content)
+
+        # the number of statements doesn't depend on the number of variables
+        self.assertLess(len(statements), 10, statements)
+        self.assertEqual(len(ct.variables.all()), 200+1)
+        self.assertEqual(
+            ct.get_template_variable_by_name("hostname").description,
+            "the hostname of the device (also used as name for the template value set)"
+        )
+
+        # existing variables are not changed, if the content is updated
+        ct.update_template_variable("interface_1", "description of the variable")
+        ct.template_content = template_content + "\n${ additional }"
+        db.session.commit()
+        self.assertEqual(len(ct.variables.all()), 200+2)
+        self.assertEqual(ct.get_template_variable_by_name("interface_1").description, "description of the variable")
+
+    def test_config_template_reconcile_values_on_content_change(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${ hostname } ${ var_1 } ${ var_2 }")
+        db.session.add(ct)
+        db.session.commit()
+
+        tvs_ids = []
+        for i in range(20):
+            tvs = TemplateValueSet("host_%d" % i, ct)
+            tvs.update_variable_values({"var_1": "value 1 %d" % i, "var_2": "value 2 %d" % i})
+            tvs_ids.append(tvs.id)
+        revisions = [TemplateValueSet.query.get(tvs_id).revision for tvs_id in tvs_ids]
+
+        with self.record_statements() as statements:
+            ct.template_content = "${ hostname } ${ var_1 } ${ var_3 }"
+
+        # the number of statements doesn't depend on the number of template value sets
+        self.assertLess(len(statements), 15, statements)
+        self.assertEqual(sorted(ct.get_template_variable_names()), ["hostname", "var_1", "var_3"])
+        self.assertEqual(len(ct.template_value_sets.all()), 20)
+
+        for i, tvs_id in enumerate(tvs_ids):
+            tvs = TemplateValueSet.query.get(tvs_id)
+            self.assertEqual(sorted(tvs.get_template_value_names()), ["hostname", "var_1", "var_3"])
+            self.assertEqual(tvs.get_template_value_by_name_as_string("hostname"), "host_%d" % i)
+            self.assertEqual(tvs.get_template_value_by_name_as_string("var_1"), "value 1 %d" % i)
+            self.assertEqual(tvs.get_template_value_by_name_as_string("var_3"), "")
+            self.assertNotEqual(tvs.revision, revisions[i])
+
+        # new template value sets get the new variables
+        tvs = TemplateValueSet("host_new", ct)
+        self.assertEqual(sorted(tvs.get_template_value_names()), ["hostname", "var_1", "var_3"])
+
+    def test_config_template_delete_value_sets_on_content_change(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${ hostname } ${ var_1 }")
+        db.session.add(ct)
+        db.session.commit()
+        tvs = TemplateValueSet("host", ct)
+        tvs.update_variable_value("var_1", "value")
+
+        ct.update_template_content("${ hostname } ${ var_2 }", keep_values=False)
+
+        self.assertEqual(len(ct.template_value_sets.all()), 0)
+        self.assertEqual(TemplateValueSet.query.count(), 0)
+        self.assertEqual(TemplateValue.query.count(), 0)
+
+        # the template content property uses the configured behaviour
+        tvs = TemplateValueSet("host", ct)
+        tvs.update_variable_value("var_2", "value")
+        app.config["RECONCILE_TEMPLATE_VALUES"] = False
+        try:
+            ct.template_content = "${ hostname } ${ var_3 }"
+
+        finally:
+            app.config["RECONCILE_TEMPLATE_VALUES"] = True
+
+        self.assertEqual(TemplateValueSet.query.count(), 0)
+
+        tvs = TemplateValueSet("host", ct)
+        tvs.update_variable_value("var_3", "value")
+        ct.template_content = "${ hostname } ${ var_3 } ${ var_4 }"
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_3"), "value")
+
     def test_config_template_update_variable(self):
         p1 = Project(name="Project 1")
         ct1 = ConfigTemplate(name="first script", project=p1)
@@ -440,6 +592,45 @@ class ConfigTemplateDataModelTest(BaseFlaskTest):
 
         self.assertEqual(tvs.get_template_value_by_name_as_string("var_1_renamed"), "first value")
 
+    def test_rename_variable_name_statement_count(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="Config Template", project=p, template_content="${ var_1 } ${ var_2 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+        for i in range(200):
+            tvs = TemplateValueSet("host_%d" % i, config_template=ct)
+            tvs.update_variable_value("var_1", "value %d" % i)
+        revision = tvs.revision
+
+        with self.record_statements() as statements:
+            ct.rename_variable(old_name="var_1", new_name="var 1 renamed")
+
+        # the number of statements doesn't depend on the number of template value sets
+        self.assertLess(len(statements), 15, statements)
+        self.assertNotIn("var_1", ct.get_template_variable_names())
+        self.assertIn("var_1_renamed", ct.get_template_variable_names())
+        self.assertEqual(TemplateValue.query.filter_by(var_name_slug="var_1").count(), 0)
+        for i, tvs in enumerate(ct.template_value_sets.order_by(TemplateValueSet.id)):
+            self.assertEqual(tvs.get_template_value_by_name_as_string("var_1_renamed"), "value %d" % i)
+        self.assertNotEqual(tvs.revision, revision)
+
+    def test_rename_variable_name_overwrites_existing_values(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="Config Template", project=p, template_content="${ var_1 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+        tvs1 = TemplateValueSet("host_1", config_template=ct)
+        tvs1.update_variable_values({"var_1": "first value", "var_2": "stale value"})
+        tvs2 = TemplateValueSet("host_2", config_template=ct)
+        tvs2.update_variable_value("var_1", "second value")
+
+        ct.rename_variable(old_name="var_1", new_name="var_2")
+
+        self.assertEqual(tvs1.get_template_value_by_name_as_string("var_2"), "first value")
+        self.assertFalse(tvs1.is_value_defined("var_1"))
+        self.assertEqual(tvs2.get_template_value_by_name_as_string("var_2"), "second value")
+        self.assertEqual(TemplateValue.query.filter_by(var_name_slug="var_2").count(), 2)
+
     def test_rename_variable_description_in_config_template(self):
         """
         test change of the description within a Config Template variable
@@ -498,6 +689,16 @@ class TemplateVariableDataModelTest(BaseFlaskTest):
 
 class TemplateValueSetDataModelTest(BaseFlaskTest):
 
+    def setUp(self):
+        super().setUp()
+        # the rendered configurations are shared within a temporary directory
+        rendered_result_cache.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rendered_result_cache.clear()
+        rendered_result_cache.directory = None
+        super().tearDown()
+
     def test_create_template_value_set(self):
         p = Project("Project")
         # create first TemplateValueSet
@@ -654,6 +855,322 @@ class TemplateValueSetDataModelTest(BaseFlaskTest):
         self.assertNotEqual(tvs1var1.value, tvs1var1_value)
         self.assertEqual(tvs1var1.value, tvs1var1_value_mod)
 
+    def test_template_value_set_update_multiple_values(self):
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p)
+        tvs = TemplateValueSet(hostname="tvs1", config_template=ct)
+        tvs.update_variable_value("first variable", "old value")
+        db.session.add_all([p, ct, tvs])
+        db.session.commit()
+
+        commits = []
+        listener = lambda session: commits.append(session)
+        event.listen(Session, "after_commit", listener)
+        try:
+            result = tvs.update_variable_values({
+                "first variable": "new value",
+                "second variable": "second value",
+                "third_variable": "third value",
+            })
+
+        finally:
+            event.remove(Session, "after_commit", listener)
+
+        # all values are written within a single commit
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(sorted(result), ["first_variable", "second_variable", "third_variable"])
+        self.assertEqual(tvs.get_template_value_by_name_as_string("first_variable"), "new value")
+        self.assertEqual(tvs.get_template_value_by_name_as_string("second_variable"), "second value")
+        self.assertEqual(tvs.get_template_value_by_name_as_string("third_variable"), "third value")
+        self.assertEqual(len(tvs.values.all()), 3+1)
+
+    def test_template_value_set_new_values_with_upsert_statements(self):
+        upsert_calls = []
+
+        def plain_insert_statement(table, index_elements, update_columns=None):
+            # the upsert statements of PostgreSQL are replaced with plain inserts on SQLite
+            upsert_calls.append((index_elements, update_columns))
+            return table.insert()
+
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${first_variable}")
+        db.session.add_all([p, ct])
+        db.session.commit()
+
+        with mock.patch("app.models.supports_upsert", return_value=True), \
+                mock.patch("app.models.upsert_statement", side_effect=plain_insert_statement):
+            # missing variables are added and existing values are kept
+            tvs = TemplateValueSet(hostname="tvs1", config_template=ct)
+            self.assertEqual(upsert_calls, [(["template_value_set_id", "var_name_slug"], None)])
+
+            # new values replace concurrently added values
+            revision = tvs.revision
+            tvs.update_variable_values({"first_variable": "first value", "second variable": "second value"})
+            self.assertEqual(upsert_calls[1], (["template_value_set_id", "var_name_slug"], ["value"]))
+            self.assertNotEqual(tvs.revision, revision)
+
+            # new variables of the Config Template
+            ct.template_content = "${first_variable} ${third_variable}"
+            db.session.commit()
+            self.assertEqual(upsert_calls[2], (["template_value_set_id", "var_name_slug"], None))
+
+        self.assertEqual(len(upsert_calls), 3)
+        self.assertEqual(tvs.get_template_value_dict(), {
+            "hostname": "tvs1",
+            "first_variable": "first value",
+            "second_variable": "second value",
+            "third_variable": ""
+        })
+
+    def test_template_value_set_value_index(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${ var_1 } ${ var_2 }")
+        db.session.add(ct)
+        db.session.commit()
+        tvs = TemplateValueSet("host", ct)
+
+        self.assertTrue(tvs.is_value_defined("var_1"))
+
+        # the lookups are served from the index
+        with self.record_statements() as statements:
+            for _ in range(100):
+                self.assertTrue(tvs.is_value_defined("var_2"))
+                self.assertFalse(tvs.is_value_defined("var_3"))
+                self.assertTrue(ct.is_variable_defined("var_1"))
+                self.assertFalse(ct.is_variable_defined("var_3"))
+
+        self.assertLess(len(statements), 5, statements)
+
+        # the index is updated on writes
+        tvs.update_variable_value("var_3", "value")
+        self.assertTrue(tvs.is_value_defined("var_3"))
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_3"), "value")
+
+        db.session.delete(tvs.get_template_value_by_name("var_3"))
+        db.session.commit()
+        self.assertFalse(tvs.is_value_defined("var_3"))
+        with self.assertRaises(TemplateValueNotFoundException):
+            tvs.get_template_value_by_name("var_3")
+
+        ct.update_template_variable("var_3", "description")
+        self.assertTrue(ct.is_variable_defined("var_3"))
+
+        # the index is rebuilt after a rollback
+        TemplateValue(tvs, "var_4", "value")
+        self.assertTrue(tvs.is_value_defined("var_4"))
+        db.session.rollback()
+        self.assertFalse(tvs.is_value_defined("var_4"))
+
+        # the index is rebuilt after a commit (the value is deleted by another session)
+        self.assertTrue(tvs.is_value_defined("var_1"))
+        with db.engine.begin() as connection:
+            connection.execute(TemplateValue.__table__.delete().where(TemplateValue.var_name_slug == "var_1"))
+        db.session.commit()
+        self.assertFalse(tvs.is_value_defined("var_1"))
+        with self.assertRaises(TemplateValueNotFoundException):
+            tvs.get_template_value_by_name_as_string("var_1")
+
+    def test_template_value_set_configuration_result_cache(self):
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p, template_content="hostname ${ hostname }\n${ var_1 }")
+        tvs = TemplateValueSet(hostname="tvs1", config_template=ct)
+        tvs.update_variable_value("var_1", "first value")
+        db.session.add_all([p, ct, tvs])
+        db.session.commit()
+
+        rendered_result_cache.clear()
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nfirst value")
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nfirst value")
+        self.assertEqual(rendered_result_cache.info()["misses"], 1)
+        self.assertEqual(rendered_result_cache.info()["hits"], 1)
+
+        # a cached result is read without flushing the pending changes of the session
+        ct.name = "renamed template"
+        with self.record_statements() as statements:
+            self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nfirst value")
+        self.assertEqual(statements, [])
+        self.assertIn(ct, db.session.dirty)
+
+        # every change of a value invalidates the cached result
+        revision = tvs.revision
+        tvs.update_variable_value("var_1", "second value")
+        self.assertNotEqual(tvs.revision, revision)
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nsecond value")
+
+        tvs.get_template_value_by_name("var_1").value = "third value"
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nthird value")
+
+        # the deleted value is not flushed yet
+        db.session.delete(tvs.get_template_value_by_name("var_1"))
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1")
+        db.session.commit()
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1")
+
+        # the bulk rendering uses the same cache
+        self.assertEqual(
+            [(obj, r.result) for obj, r in ct.get_configuration_results()],
+            [(tvs, "hostname tvs1")]
+        )
+        self.assertEqual(rendered_result_cache.info()["misses"], 4)
+
+        # a change of the template content results in a different key
+        ct._template_content = "hostname ${ hostname }!"
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1!")
+
+    def test_config_template_load_all_values(self):
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p, template_content="hostname ${ hostname }\n${ var_1 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+        for i in range(100):
+            tvs = TemplateValueSet(hostname="tvs%d" % i, config_template=ct)
+            tvs.update_variable_value("var_1", "value %d" % i)
+        rendered_result_cache.clear()
+
+        with self.record_statements() as statements:
+            value_dicts = ct.get_template_value_dicts()
+            results = list(ct.get_configuration_results(yield_per=7))
+
+        # the number of statements doesn't depend on the number of template value sets
+        self.assertLess(len(statements), 5, statements)
+        self.assertEqual(len(value_dicts), 100)
+        self.assertEqual(value_dicts["tvs42"], {"hostname": "tvs42", "var_1": "value 42"})
+        self.assertEqual(list(value_dicts.keys())[:2], ["tvs0", "tvs1"])
+        self.assertEqual(len(results), 100)
+        for tvs, render_result in results:
+            self.assertEqual(render_result.result, "hostname %s\n%s" % (
+                tvs.hostname, tvs.get_template_value_by_name_as_string("var_1")
+            ))
+
+        # only the changed template value set is rendered again
+        tvs = TemplateValueSet.query.filter_by(hostname="tvs10").first()
+        tvs.update_variable_value("var_1", "changed")
+        misses = rendered_result_cache.info()["misses"]
+        results = dict((tvs.hostname, r.result) for tvs, r in ct.get_configuration_results())
+        self.assertEqual(results["tvs10"], "hostname tvs10\nchanged")
+        self.assertEqual(results["tvs11"], "hostname tvs11\nvalue 11")
+        self.assertEqual(rendered_result_cache.info()["misses"], misses + 1)
+
+    def test_config_template_template_value_set_page(self):
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p, template_content="hostname ${ hostname }\n${ var_1 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+        for i in range(25):
+            tvs = TemplateValueSet(hostname="router-%02d" % i, config_template=ct)
+            tvs.update_variable_value("var_1", "value %d" % i)
+        TemplateValueSet(hostname="switch-01", config_template=ct)
+        db.session.commit()
+
+        with self.record_statements() as statements:
+            page, next_hostname = ct.get_template_value_set_page(per_page=10)
+
+        # the number of statements doesn't depend on the page size
+        self.assertLess(len(statements), 4, statements)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router-%02d" % i for i in range(10)])
+        self.assertEqual(page[3][2], {"hostname": "router-03", "var_1": "value 3"})
+        self.assertEqual(next_hostname, "router-09")
+
+        # continue after the last hostname of the page
+        page, next_hostname = ct.get_template_value_set_page(after_hostname=next_hostname, per_page=10)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router-%02d" % i for i in range(10, 20)])
+        page, next_hostname = ct.get_template_value_set_page(after_hostname=next_hostname, per_page=10)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router-%02d" % i for i in range(20, 25)] +
+                         ["switch-01"])
+        self.assertIsNone(next_hostname)
+
+        # filter by hostname prefix
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="router-1", per_page=10)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router-%02d" % i for i in range(10, 20)])
+        self.assertIsNone(next_hostname)
+
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="switch", per_page=10)
+        self.assertEqual([hostname for _, hostname, _ in page], ["switch-01"])
+
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="firewall", per_page=10)
+        self.assertEqual(page, [])
+        self.assertIsNone(next_hostname)
+
+        # the prefix is matched case sensitive and literally (independent of the collation of the database)
+        for hostname in ["router10", "Router-10", "router_10", "router%10"]:
+            TemplateValueSet(hostname=hostname, config_template=ct)
+        db.session.commit()
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="router-1", per_page=20)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router-%02d" % i for i in range(10, 20)])
+
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="router_", per_page=20)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router_10"])
+
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="router%", per_page=20)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router%10"])
+
+        # a prefix that ends with the last code point has no upper bound
+        TemplateValueSet(hostname="router\U0010ffff-01", config_template=ct)
+        db.session.commit()
+        page, next_hostname = ct.get_template_value_set_page(hostname_prefix="router\U0010ffff", per_page=20)
+        self.assertEqual([hostname for _, hostname, _ in page], ["router\U0010ffff-01"])
+
+        with self.assertRaises(ValueError):
+            ct.get_template_value_set_page(per_page=0)
+
+    def test_template_value_set_packed_storage(self):
+        p = Project("Project")
+        ct = ConfigTemplate(name="template", project=p, template_content="hostname ${ hostname }\n${ var_1 }")
+        db.session.add_all([p, ct])
+        db.session.commit()
+
+        tvs = TemplateValueSet(hostname="tvs1", config_template=ct, packed=True)
+        self.assertTrue(tvs.is_packed)
+        self.assertEqual(TemplateValue.query.count(), 0)
+        self.assertEqual(sorted(tvs.get_template_value_names()), ["hostname", "var_1"])
+        self.assertEqual(tvs.get_template_value_by_name_as_string("hostname"), "tvs1")
+
+        tvs.update_variable_value("var_1", "first value")
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_1"), "first value")
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nfirst value")
+
+        tvs.get_template_value_by_name("var_1").value = "second value"
+        db.session.commit()
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nsecond value")
+        self.assertEqual([val.var_name for val in tvs.get_template_variables()], ["hostname", "var_1"])
+
+        # bulk operations of the config template
+        ct.template_content = "hostname ${ hostname }\n${ var_1 } ${ var_2 }"
+        self.assertEqual(tvs.get_template_value_dict(), {"hostname": "tvs1", "var_1": "second value", "var_2": ""})
+        ct.rename_variable("var_1", "var_renamed")
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_renamed"), "second value")
+        ct.template_content = "hostname ${ hostname }\n${ var_renamed }"
+        self.assertEqual(tvs.get_template_value_dict(), {"hostname": "tvs1", "var_renamed": "second value"})
+        self.assertEqual(TemplateValue.query.count(), 0)
+
+        # mixed storage within a config template, the values are loaded with a single row per template value set
+        row_tvs = TemplateValueSet(hostname="tvs2", config_template=ct, packed=False)
+        row_tvs.update_variable_value("var_renamed", "row value")
+        self.assertEqual(ct.get_template_value_dicts(), {
+            "tvs1": {"hostname": "tvs1", "var_renamed": "second value"},
+            "tvs2": {"hostname": "tvs2", "var_renamed": "row value"}
+        })
+
+        # convert the storage of all template value sets
+        self.assertEqual(ct.set_packed_storage(True), 1)
+        self.assertTrue(row_tvs.is_packed)
+        self.assertEqual(TemplateValue.query.count(), 0)
+        self.assertEqual(row_tvs.get_template_value_by_name_as_string("var_renamed"), "row value")
+
+        self.assertEqual(ct.set_packed_storage(False), 2)
+        self.assertFalse(tvs.is_packed)
+        self.assertEqual(TemplateValue.query.count(), 4)
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_renamed"), "second value")
+        self.assertEqual(
+            [r.result for _, r in ct.get_configuration_results()],
+            ["hostname tvs1\nsecond value", "hostname tvs2\nrow value"]
+        )
+
+        tvs.set_packed_storage(True)
+        self.assertTrue(tvs.is_packed)
+        self.assertEqual(TemplateValue.query.count(), 2)
+        self.assertEqual(tvs.get_configuration_result(), "hostname tvs1\nsecond value")
+
     def test_template_value_set_delete_cascade_option(self):
         p = Project("project")
         ct1 = ConfigTemplate(name="Config Template", project=p)
@@ -751,6 +1268,30 @@ class TemplateValueSetDataModelTest(BaseFlaskTest):
         self.assertTrue(tvs.is_value_defined("var_3"))
         self.assertTrue(tvs.is_value_defined("hostname"))
 
+    def test_template_value_set_copy_variable_function_statement_count(self):
+        p = Project("project")
+        ct = ConfigTemplate(name="my template", project=p)
+        for i in range(50):
+            ct.update_template_variable("var %d" % i)
+        db.session.add_all([p, ct])
+        db.session.commit()
+
+        with self.record_statements() as statements:
+            tvs = TemplateValueSet(hostname="tvs", config_template=ct)
+
+        # the number of statements doesn't depend on the number of variables
+        self.assertLess(len(statements), 10, statements)
+        self.assertEqual(len(tvs.values.all()), 50+1)
+        self.assertEqual(tvs.get_template_value_by_name_as_string("hostname"), "tvs")
+
+        # existing values are kept, the hostname is updated
+        tvs.update_variable_value("var_1", "value")
+        tvs.hostname = "new hostname"
+        tvs.copy_variables_from_config_template()
+        self.assertEqual(len(tvs.values.all()), 50+1)
+        self.assertEqual(tvs.get_template_value_by_name_as_string("var_1"), "value")
+        self.assertEqual(tvs.get_template_value_by_name_as_string("hostname"), "new hostname")
+
     def test_variable_name_conversion(self):
         p = Project("project")
         ct = ConfigTemplate("config template", project=p)
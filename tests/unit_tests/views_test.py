@@ -1,16 +1,21 @@
 """
 basic view tests for the Flask application
 """
+import io
 import json
 import os
 import shutil
+import tempfile
+import zipfile
 
 import time
+from unittest import mock
 from flask import url_for
 from slugify.main import Slugify
 
 from app import db, app
-from app.models import Project, ConfigTemplate, TemplateValueSet, TemplateVariable
+from app.context_processors import get_all_project_data
+from app.models import Project, ConfigTemplate, TemplateValueSet, TemplateVariable, ProjectDataRevision
 from tests import BaseFlaskTest
 
 
@@ -72,6 +77,78 @@ class CommonSiteTest(BaseFlaskTest):
         self.assertTrue("celery_worker" in content.keys())
 
 
+    def test_cached_sidebar_data(self):
+        """
+        the sidebar data is loaded once and invalidated if a project or config template is changed
+        :return:
+        """
+        p1 = Project("first project")
+        p2 = Project("second project")
+        ct1 = ConfigTemplate(name="first template", project=p1)
+        ct2 = ConfigTemplate(name="second template", project=p1)
+        db.session.add_all([p1, p2, ct1, ct2])
+        db.session.commit()
+
+        data = get_all_project_data()
+        with self.record_statements() as statements:
+            data_cached = get_all_project_data()
+
+        # only the revision is checked
+        self.assertEqual(len(statements), 1, statements)
+        self.assertIs(data, data_cached)
+        self.assertEqual(data, [
+            {
+                "id": p1.id,
+                "name": "first project",
+                "config_templates": [
+                    {"id": ct1.id, "name": "first template"},
+                    {"id": ct2.id, "name": "second template"}
+                ]
+            },
+            {
+                "id": p2.id,
+                "name": "second project",
+                "config_templates": []
+            }
+        ])
+
+        # changes that are not shown in the sidebar keep the cached data
+        revision = ProjectDataRevision.get_revision(db.session)
+        ct2.template_content = "${hostname}"
+        db.session.commit()
+        self.assertEqual(ProjectDataRevision.get_revision(db.session), revision)
+        self.assertIs(get_all_project_data(), data)
+
+        ct2.name = "renamed template"
+        db.session.commit()
+        self.assertEqual(ProjectDataRevision.get_revision(db.session), revision + 1)
+        self.assertEqual(get_all_project_data()[0]["config_templates"][1]["name"], "renamed template")
+
+        db.session.delete(p1)
+        db.session.commit()
+        self.assertEqual([p["name"] for p in get_all_project_data()], ["second project"])
+
+        # uncommitted changes are not cached
+        db.session.add(Project("third project"))
+        db.session.flush()
+        self.assertEqual(len(get_all_project_data()), 2)
+        db.session.rollback()
+        self.assertEqual(len(get_all_project_data()), 1)
+
+        response = self.client.get(url_for("home"))
+        self.assert200(response)
+        self.assertIn("second project", response.data.decode("utf-8"))
+
+        # changes of other processes are detected using the revision
+        data = get_all_project_data()
+        with db.engine.begin() as connection:
+            connection.execute(Project.__table__.insert().values(name="other process project"))
+            ProjectDataRevision.increment(connection)
+
+        self.assertIsNot(get_all_project_data(), data)
+        self.assertEqual([p["name"] for p in get_all_project_data()], ["second project", "other process project"])
+
+
 class ProjectViewTest(BaseFlaskTest):
 
     def setUp(self):
@@ -340,6 +417,105 @@ class ConfigTemplateViewTest(BaseFlaskTest):
         self.assertIn(var_2_name, response.data.decode("utf-8"))
         self.assertIn(var_2_desc, response.data.decode("utf-8"))
 
+    def test_view_config_template_pagination(self):
+        """
+        test the pages of Template Value Sets within the config template view
+        :return:
+        """
+        app.config["TEMPLATE_VALUE_SETS_PER_PAGE"] = 10
+        p = Project("My Project")
+        ct = ConfigTemplate("Template name", project=p, template_content="${ var_1 }")
+        db.session.add(p)
+        db.session.add(ct)
+        db.session.commit()
+        for i in range(15):
+            tvs = TemplateValueSet(hostname="router-%02d" % i, config_template=ct)
+            tvs.update_variable_value("var_1", "value_%d" % i)
+
+        try:
+            response = self.client.get(url_for("view_config_template", project_id=p.id, config_template_id=ct.id))
+            self.assert200(response)
+            content = response.data.decode("utf-8")
+            self.assertIn("router-09", content)
+            self.assertIn("value_9", content)
+            self.assertNotIn("router-10", content)
+            self.assertIn('id="load_more_template_value_sets"', content)
+
+            response = self.client.get(url_for("view_config_template", project_id=p.id, config_template_id=ct.id,
+                                               after="router-09"))
+            self.assert200(response)
+            content = response.data.decode("utf-8")
+            self.assertNotIn("router-09", content)
+            self.assertIn("router-14", content)
+            self.assertNotIn('id="load_more_template_value_sets"', content)
+
+            response = self.client.get(url_for("view_config_template", project_id=p.id, config_template_id=ct.id,
+                                               prefix="router-1"))
+            self.assert200(response)
+            content = response.data.decode("utf-8")
+            self.assertNotIn("router-09", content)
+            self.assertIn("router-10", content)
+
+            response = self.client.get(url_for("view_config_template", project_id=p.id, config_template_id=ct.id,
+                                               prefix="switch"))
+            self.assert200(response)
+            self.assertIn("There are no <strong>Template Value Sets</strong> with a hostname that starts with",
+                          response.data.decode("utf-8"))
+
+        finally:
+            app.config["TEMPLATE_VALUE_SETS_PER_PAGE"] = 100
+
+    def test_template_value_sets_json(self):
+        """
+        test the JSON endpoint that is used for the infinite scrolling of the Template Value Sets
+        :return:
+        """
+        app.config["TEMPLATE_VALUE_SETS_PER_PAGE"] = 10
+        p = Project("My Project")
+        ct = ConfigTemplate("Template name", project=p, template_content="${ var_1 }")
+        db.session.add(p)
+        db.session.add(ct)
+        db.session.commit()
+        for i in range(15):
+            tvs = TemplateValueSet(hostname="router-%02d" % i, config_template=ct)
+            tvs.update_variable_value("var_1", "value_%d" % i)
+
+        try:
+            response = self.client.get(url_for("template_value_sets_json", config_template_id=ct.id))
+            self.assert200(response)
+            content = json.loads(response.data.decode("utf-8"))
+            self.assertEqual(len(content["template_value_sets"]), 10)
+            self.assertEqual(content["template_value_sets"][2]["hostname"], "router-02")
+            self.assertEqual(content["template_value_sets"][2]["values"], {"hostname": "router-02", "var_1": "value_2"})
+            self.assertEqual(
+                content["template_value_sets"][2]["urls"]["view"],
+                url_for("view_template_value_set", config_template_id=ct.id,
+                        template_value_set_id=content["template_value_sets"][2]["id"])
+            )
+            self.assertEqual(content["next_hostname"], "router-09")
+            self.assertEqual(
+                content["next_page"],
+                url_for("view_config_template", project_id=p.id, config_template_id=ct.id, after="router-09")
+            )
+
+            response = self.client.get(content["next"])
+            self.assert200(response)
+            content = json.loads(response.data.decode("utf-8"))
+            self.assertEqual([e["hostname"] for e in content["template_value_sets"]],
+                             ["router-%02d" % i for i in range(10, 15)])
+            self.assertIsNone(content["next"])
+            self.assertIsNone(content["next_page"])
+
+            response = self.client.get(url_for("template_value_sets_json", config_template_id=ct.id, prefix="router-1"))
+            content = json.loads(response.data.decode("utf-8"))
+            self.assertEqual(len(content["template_value_sets"]), 5)
+
+            response = self.client.get(url_for("template_value_sets_json", config_template_id=9999))
+            self.assert404(response)
+
+        finally:
+            app.config["TEMPLATE_VALUE_SETS_PER_PAGE"] = 100
+
     def test_view_config_template_404(self):
         """
         test config template view not found
@@ -1052,6 +1228,72 @@ nothing (there is the error)
         self.assertEqual(received_tvs5.get_template_value_by_name_as_string("variable_two"), "55")
         self.assertEqual(received_tvs5.get_template_value_by_name_as_string("variable_three"), "555")
 
+    def test_download_template_values_as_csv(self):
+        """Test the download of the values of all Template Value Sets as CSV file
+
+        :return:
+        """
+        p = Project("project name")
+        ct1 = ConfigTemplate(name="template name", template_content="${variable_one}", project=p)
+        tvs1 = TemplateValueSet(hostname="host_A", config_template=ct1)
+        tvs1.update_variable_value("variable_one", "1")
+        TemplateValueSet(hostname="host_B", config_template=ct1)
+        db.session.add_all([p, ct1])
+        db.session.commit()
+
+        response = self.client.get(
+            url_for(
+                "download_config_template_values_as_csv",
+                project_id=ct1.project.id,
+                config_template_id=ct1.id
+            )
+        )
+        self.assert200(response)
+        self.assertEqual(response.mimetype, "text/csv")
+        self.assertIn("attachment", response.headers["Content-Disposition"])
+        self.assertEqual(response.data.decode("utf-8"), "hostname;variable_one\nhost_A;1\nhost_B;\n")
+
+        response = self.client.get(
+            url_for(
+                "edit_all_config_template_values",
+                project_id=ct1.project.id,
+                config_template_id=ct1.id
+            )
+        )
+        self.assert200(response)
+        self.assertIn("hostname;variable_one\nhost_A;1\nhost_B;</textarea>", response.data.decode("utf-8"))
+
+    def test_add_template_value_sets_using_a_csv_file_upload(self):
+        """Test the bulk creation of Template Value Sets using an uploaded CSV file
+
+        :return:
+        """
+        p = Project("project name")
+        ct1 = ConfigTemplate(name="template name", template_content="${variable_one}", project=p)
+        db.session.add_all([p, ct1])
+        db.session.commit()
+
+        data = {
+            "csv_content": "hostname;variable_one\nignored_host;1",
+            "csv_file": (io.BytesIO(b"hostname;variable_one\nhost_A;1\nhost_B;2\n"), "values.csv")
+        }
+        response = self.client.post(
+            url_for(
+                "edit_all_config_template_values",
+                project_id=ct1.project.id,
+                config_template_id=ct1.id
+            ),
+            data=data,
+            content_type="multipart/form-data",
+            follow_redirects=True
+        )
+        self.assert200(response)
+        self.assertTemplateUsed("config_template/view_config_template.html")
+        self.assertEqual(sorted(tvs.hostname for tvs in TemplateValueSet.query.all()), ["host_A", "host_B"])
+
+        tvs = TemplateValueSet.query.filter(TemplateValueSet.hostname == "host_B").first()
+        self.assertEqual(tvs.get_template_value_by_name_as_string("variable_one"), "2")
+
     def test_export_configurations_view(self):
         """simple test to avoid errors in the view
 
@@ -1524,6 +1766,97 @@ class ConfigurationViewTest(BaseFlaskTest):
         self.assert200(response)
         # the content is validated within a functional test case
 
+    def test_download_all_configurations_as_stream(self):
+        """test the content of the streamed ZIP archive, failed configurations are added as error file
+
+        :return:
+        """
+        template_content = "!\nhostname ${hostname}\n!\n${ 10 / int(variable_1) }"
+
+        p = Project("My Project")
+        ct = ConfigTemplate("Template name", project=p, template_content=template_content)
+
+        tvs1 = TemplateValueSet(hostname="hostname_A", config_template=ct)
+        tvs1.update_variable_value("variable_1", "5")
+        tvs2 = TemplateValueSet(hostname="hostname_B", config_template=ct)
+        tvs2.update_variable_value("variable_1", "0")
+
+        db.session.add_all([p, ct, tvs1, tvs2])
+        db.session.commit()
+
+        response = self.client.get(
+            url_for("download_all_config_as_zip", project_id=ct.project.id, config_template_id=ct.id)
+        )
+        self.assert200(response)
+        self.assertEqual(response.mimetype, "application/zip")
+        self.assertIn("Template name_configs.zip", response.headers["Content-Disposition"])
+
+        zf = zipfile.ZipFile(io.BytesIO(response.data))
+        self.assertEqual(sorted(zf.namelist()), ["hostname_A_config.txt", "hostname_B_error.txt"])
+        self.assertEqual(zf.read("hostname_A_config.txt").decode("utf-8"), "!\nhostname hostname_A\n!\n2.0")
+        self.assertIn("division by zero", zf.read("hostname_B_error.txt").decode("utf-8"))
+
+
+class CsvImportTaskViewTest(BaseFlaskTest):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_import_directory = app.config["CSV_IMPORT_DIRECTORY"]
+        app.config["CSV_IMPORT_DIRECTORY"] = os.path.join(tempfile.mkdtemp(), "csv_import")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(app.config["CSV_IMPORT_DIRECTORY"]))
+        app.config["CSV_IMPORT_DIRECTORY"] = self.csv_import_directory
+        super().tearDown()
+
+    @mock.patch("app.views.ajax_views.import_template_value_sets_from_csv_file")
+    def test_import_template_value_sets_csv_task(self, import_task):
+        """
+        the uploaded CSV file is stored within the CSV import directory and passed to the celery task
+        :return:
+        """
+        import_task.delay.return_value.id = "test-task-id"
+        p = Project(name="project")
+        ct = ConfigTemplate(name="template", project=p, template_content="${hostname}")
+        db.session.add_all([p, ct])
+        db.session.commit()
+
+        response = self.client.post(
+            url_for("import_template_value_sets_csv_task", config_template_id=ct.id),
+            data={"csv_file": (io.BytesIO(b"hostname\nhost_A\n"), "values.csv")}
+        )
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            response.headers["Location"],
+            "http://localhost%s" % url_for("task_status_json", task_id="test-task-id")
+        )
+        import_task.delay.assert_called_once_with(ct.id, mock.ANY)
+        csv_file_path = import_task.delay.call_args[0][1]
+        self.assertEqual(os.path.dirname(csv_file_path), app.config["CSV_IMPORT_DIRECTORY"])
+        with open(csv_file_path, "rb") as f:
+            self.assertEqual(f.read(), b"hostname\nhost_A\n")
+
+        # request without a CSV file
+        response = self.client.post(url_for("import_template_value_sets_csv_task", config_template_id=ct.id))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(import_task.delay.call_count, 1)
+
+    @mock.patch("app.views.ajax_views.import_template_value_sets_from_csv_file")
+    def test_import_template_value_sets_csv_task_with_invalid_config_template(self, import_task):
+        """
+        the upload to an unknown config template is rejected without a celery task
+        :return:
+        """
+        response = self.client.post(
+            url_for("import_template_value_sets_csv_task", config_template_id=9999),
+            data={"csv_file": (io.BytesIO(b"hostname\nhost_A\n"), "values.csv")}
+        )
+
+        self.assert404(response)
+        self.assertFalse(import_task.delay.called)
+        self.assertFalse(os.path.exists(app.config["CSV_IMPORT_DIRECTORY"]))
+
 
 class CeleryTaskTest(BaseFlaskTest):
 